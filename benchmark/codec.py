@@ -0,0 +1,51 @@
+import time
+import timeit
+
+from common.codec import CODEC_JSON, CODEC_MSGPACK, available, decode, encode
+from common.telemetry import batch_message
+
+
+def single_message():
+    # what BaseDevice.record_data sends for one reading
+    return {
+        'tags': {
+            'area': 'area1',
+            'device': 'temperature_sensor_1',
+        },
+        'fields': {
+            'value': 23.57,
+            'unit': 'C',
+        },
+    }
+
+
+def batch(n):
+    tags = {
+        'area': 'area1',
+        'device': 'temperature_sensor_1',
+    }
+    now = time.time_ns()
+    return batch_message(tags, [({'value': 20 + i % 100 / 10, 'unit': 'C'}, now + i * 10 ** 9) for i in range(n)])
+
+
+def run(name, message, rounds):
+    print(name)
+    base = None
+    for codec in [CODEC_JSON, CODEC_MSGPACK]:
+        if available(codec) is False:
+            print(f'  {codec:>8}: not installed')
+            continue
+        payload = encode(message, codec)
+        assert decode(payload) == message
+        enc = timeit.timeit(lambda: encode(message, codec), number=rounds) / rounds
+        dec = timeit.timeit(lambda: decode(payload), number=rounds) / rounds
+        if base is None:
+            base = len(payload)
+        print(f'  {codec:>8}: {len(payload):7d} bytes ({len(payload) / base:4.2f}), '
+              f'encode {enc * 1e6:8.2f} us, decode {dec * 1e6:8.2f} us')
+
+
+if __name__ == '__main__':
+    run('single reading', single_message(), 100000)
+    run('batch of 10', batch(10), 20000)
+    run('batch of 100', batch(100), 2000)
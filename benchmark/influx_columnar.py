@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytz
+from common.time import str_to_time, time_to_str, time_convert_timezone
+from database.influxdb.connector import Connector
+from database.influxdb.query import QueryFilter
+
+ANNOTATIONS = ('#datatype,string,long,dateTime:RFC3339,dateTime:RFC3339,dateTime:RFC3339,double,'
+               'string,string,string,string\r\n'
+               '#group,false,false,true,true,false,false,true,true,true,true\r\n'
+               '#default,_result,,,,,,,,,\r\n')
+HEADER = ',result,table,_start,_stop,_time,_value,_field,_measurement,area,device\r\n'
+
+
+def build_csv(n):
+    begin = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    lines = []
+    for i in range(n):
+        t = (begin + timedelta(seconds=300 * i, microseconds=i)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        lines.append(f',,0,2024-01-01T00:00:00Z,2025-01-01T00:00:00Z,{t},{20 + i % 10 / 3},value,temperature,'
+                     f'area{i % 5},device{i % 20}\r\n')
+    return ''.join(lines)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # stand-in for the influxdb query endpoint, honours the csv dialect annotations;
+    # the responses are encoded once, the server runs in the measured process
+    responses = {}  # annotated -> body
+
+    @staticmethod
+    def set_rows(n):
+        text = HEADER + build_csv(n)
+        QueryHandler.responses = {
+            False: text.encode('utf-8'),
+            True: (ANNOTATIONS + text).encode('utf-8'),
+        }
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        annotations = request.get('dialect', {}).get('annotations')
+        data = QueryHandler.responses[annotations is None or len(annotations) > 0]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def record_path(connector, n):
+    # previous path: FluxRecord -> dict per row -> timezone per row -> json
+    result = connector.query(QueryFilter('temperature'), size=n)
+    for i in range(len(result)):
+        created_at = str_to_time(result[i]['created_at'])
+        result[i]['created_at'] = time_to_str(time_convert_timezone(created_at, pytz.utc, 'Europe/Rome'))
+    return json.dumps({'list': result})
+
+
+def columnar_path(connector, n):
+    return json.dumps({'columns': connector.query_columns(QueryFilter('temperature'), size=n, tz='Europe/Rome')})
+
+
+def measure(func, connector, n):
+    begin = time.process_time()
+    payload = func(connector, n)
+    cost = time.process_time() - begin
+    tracemalloc.start()
+    func(connector, n)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cost, peak, len(payload)
+
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), QueryHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    c = Connector(f'http://127.0.0.1:{server.server_address[1]}', 'token', 'org', 'data')
+    for size in (10000, 100000):
+        QueryHandler.set_rows(size)
+        r_cpu, r_mem, r_len = measure(record_path, c, size)
+        c_cpu, c_mem, c_len = measure(columnar_path, c, size)
+        print(f'{size:>7} rows: records {r_cpu * 1000:8.1f} ms cpu {r_mem / 2 ** 20:7.1f} MiB peak {r_len / 2 ** 20:6.1f} MiB json | '
+              f'columnar {c_cpu * 1000:7.1f} ms cpu {c_mem / 2 ** 20:6.1f} MiB peak {c_len / 2 ** 20:5.1f} MiB json | '
+              f'cpu x{r_cpu / c_cpu:.1f}, memory x{r_mem / c_mem:.1f}')
+    c.close()
+    server.shutdown()
@@ -0,0 +1,48 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from database.influxdb.connector import Connector
+
+RTT = 0.002  # simulated network round trip, seconds
+
+
+class WriteHandler(BaseHTTPRequestHandler):
+    # stand-in for the influxdb write endpoint
+    lines = 0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        WriteHandler.lines += body.count(b'\n') + 1
+        time.sleep(RTT)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def run(connector, n):
+    begin = time.perf_counter()
+    for i in range(n):
+        connector.insert('temperature', {'area': f'area{i % 10}', 'device': f'device{i % 100}'},
+                         {'value': 20.0 + i % 7})
+    connector.flush()
+    return n / (time.perf_counter() - begin)
+
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WriteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    sync_connector = Connector(url, 'token', 'org', 'data')
+    print(f'synchronous: {run(sync_connector, 1000):10.0f} points/sec')
+    sync_connector.close()
+
+    batch_connector = Connector(url, 'token', 'org', 'data', batch_size=500, flush_interval=0.1)
+    print(f'batched:     {run(batch_connector, 50000):10.0f} points/sec')
+    batch_connector.close()
+    print(f'endpoint received {WriteHandler.lines} lines')
+    server.shutdown()
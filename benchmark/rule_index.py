@@ -0,0 +1,94 @@
+import random
+import timeit
+
+import constants.entity
+import constants.rule
+from common.command import CommandPublisher
+from service.rule.converter import convert_checker, convert_message
+from service.rule.index import RuleIndex
+from service.rule.rule_service import RuleService
+
+ENTITIES = [constants.entity.TEMPERATURE, constants.entity.HUMIDITY, constants.entity.SOIL]
+COMPARES = [constants.rule.COMPARE_GREATER_THAN, constants.rule.COMPARE_LESS_THAN, constants.rule.COMPARE_EQUAL]
+
+
+class QuietLogger:
+    def info(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+
+def build_rules(n, devices):
+    rules = []
+    for i in range(n):
+        rules.append({
+            'id': i,
+            'src': f'device{random.randrange(devices)}',
+            'entity': random.choice(ENTITIES),
+            'field': 'value',
+            'compare': random.choice(COMPARES),
+            'value': float(random.randrange(10, 40)),
+            'opt': constants.rule.OPT_LIGHT_ON,
+            'dst': 'light',
+        })
+    return rules
+
+
+def build_messages(n, devices):
+    return [(random.choice(ENTITIES), {'tags': {'device': f'device{random.randrange(devices)}'}},
+             {'value': random.uniform(10, 40)}, i / 1000) for i in range(n)]
+
+
+def linear_check(service, rule_list, entity, data_dict, fields, at):
+    # previous RuleService.mqtt_data, kept as the baseline
+    for r in rule_list:
+        if entity != r['entity']:
+            continue
+        if "tags" not in data_dict or "device" not in data_dict['tags'] or r['src'] != data_dict["tags"]["device"]:
+            continue
+        checker = convert_checker(r['compare'], r['value'])
+        match, ok = checker(fields[r['field']])
+        if ok and match:
+            target, msg, ok = convert_message(r['dst'], r['opt'])
+            if ok:
+                service.mqtt_publish(service.command_channel + target, msg)
+
+
+def run(rule_count, message_count, devices, rate=1000):
+    service = RuleService.__new__(RuleService)
+    service.command_channel = 'command/'
+    service.logger = QuietLogger()
+    published = []
+    service.mqtt_publish = lambda topic, msg: published.append((topic, msg))
+    # no suppression, every command is counted
+    service.command_publisher = CommandPublisher(service.mqtt_publish, service.command_channel, window=0, report=0)
+
+    rules = build_rules(rule_count, devices)
+    messages = build_messages(message_count, devices)
+    service.rule_index = RuleIndex(rules)
+    build = timeit.timeit(lambda: RuleIndex(rules), number=1)
+
+    for message in messages:
+        linear_check(service, rules, *message)
+    expected = set(published)
+    published.clear()
+    for message in messages:
+        service.check_rules(*message)
+    # the index only sends a command when a rule becomes active, the baseline on every match
+    assert set(published) <= expected
+
+    linear = timeit.timeit(lambda: [linear_check(service, rules, *m) for m in messages], number=1)
+    index = timeit.timeit(lambda: [service.check_rules(*m) for m in messages], number=3) / 3
+    print(f'{rule_count} rules, {devices} devices, {message_count} messages (index built in {build * 1e3:.1f} ms)')
+    print(f'  linear scan: {linear / message_count * 1e6:9.2f} us/msg, {linear / message_count * rate * 100:6.1f}% '
+          f'of one core at {rate} msg/s')
+    print(f'  rule index : {index / message_count * 1e6:9.2f} us/msg, {index / message_count * rate * 100:6.1f}% '
+          f'of one core at {rate} msg/s, speedup x{linear / index:.0f}')
+
+
+if __name__ == '__main__':
+    random.seed(1)
+    run(10000, 1000, 1000)
+    run(10000, 1000, 100)
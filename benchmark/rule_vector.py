@@ -0,0 +1,102 @@
+import random
+import time
+
+import constants.entity
+import constants.rule
+from common.command import CommandPublisher
+from service.rule.index import RuleIndex
+from service.rule.rule_service import RuleService
+from service.rule.vector import VectorRules
+
+ENTITIES = [constants.entity.TEMPERATURE, constants.entity.HUMIDITY, constants.entity.SOIL]
+COMPARES = [constants.rule.COMPARE_GREATER_THAN, constants.rule.COMPARE_LESS_THAN,
+            constants.rule.COMPARE_GREATER_THAN_EQUAL, constants.rule.COMPARE_LESS_THAN_EQUAL]
+
+
+class QuietLogger:
+    def info(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+
+def build_rules(n, devices, targets):
+    return [{
+        'id': i,
+        'src': f'device{random.randrange(devices)}',
+        'entity': random.choice(ENTITIES),
+        'field': 'value',
+        'compare': random.choice(COMPARES),
+        'value': float(random.randrange(10, 40)),
+        'opt': random.choice([constants.rule.OPT_LIGHT_ON, constants.rule.OPT_LIGHT_OFF]),
+        'dst': f'actuator{i % targets}',
+    } for i in range(n)]
+
+
+def build_samples(n, devices):
+    return [(random.choice(ENTITIES), f'device{random.randrange(devices)}', {'value': random.uniform(10, 40)})
+            for _ in range(n)]
+
+
+def per_message(rules, samples):
+    # RuleService.check_rules for every sample, commands in the order they are published
+    service = RuleService.__new__(RuleService)
+    service.command_channel = ''
+    service.logger = QuietLogger()
+    published = []
+    service.mqtt_publish = lambda topic, msg: published.append((topic, msg))
+    # no suppression, every command is counted
+    service.command_publisher = CommandPublisher(service.mqtt_publish, service.command_channel, window=0, report=0)
+    service.rule_index = RuleIndex(rules)
+    begin = time.perf_counter()
+    for i, (entity, device, fields) in enumerate(samples):
+        service.check_rules(entity, {'tags': {'device': device}}, fields, i)
+    return time.perf_counter() - begin, published
+
+
+def vectorized(rules, samples, batch):
+    engine = VectorRules(rules)
+    published = []
+    begin = time.perf_counter()
+    for i in range(0, len(samples), batch):
+        for target, (msg, _) in engine.evaluate(samples[i:i + batch]).items():
+            published.append((target, msg))
+    return time.perf_counter() - begin, published
+
+
+def check(devices=50):
+    # every rule its own target and batches of one sample: same commands as the per message path
+    rules = build_rules(2000, devices, 2000)
+    samples = build_samples(2000, devices)
+    _, expected = per_message(rules, samples)
+    _, published = vectorized(rules, samples, 1)
+    assert sorted(published) == sorted(expected), (len(published), len(expected))
+
+
+def run(rule_count, sample_count, devices, targets):
+    rules = build_rules(rule_count, devices, targets)
+    samples = build_samples(sample_count, devices)
+    begin = time.perf_counter()
+    engine = VectorRules(rules)
+    build = time.perf_counter() - begin
+    begin = time.perf_counter()
+    engine.patch([dict(rules[0], value=rules[0]['value'] + 1)])
+    patch = time.perf_counter() - begin
+
+    base, base_published = per_message(rules, samples)
+    print(f'{rule_count} rules, {sample_count} samples, {devices} devices, {targets} targets '
+          f'(vector rules built in {build * 1e3:.0f} ms, one rule patched in {patch * 1e3:.0f} ms)')
+    print(f'  per message  : {base:7.3f} s, {sample_count / base:9.0f} samples/s, '
+          f'{len(base_published)} commands')
+    for batch in [10, 100, 1000, sample_count]:
+        elapsed, published = vectorized(rules, samples, batch)
+        print(f'  batch {batch:>6} : {elapsed:7.3f} s, {sample_count / elapsed:9.0f} samples/s, '
+              f'{len(published)} commands after dedup, speedup x{base / elapsed:.1f}')
+
+
+if __name__ == '__main__':
+    random.seed(1)
+    check()
+    run(100000, 10000, 1000, 500)
+    run(100000, 10000, 100, 500)
@@ -0,0 +1,53 @@
+import random
+import time
+
+from service.schedule.timer import Scheduler
+
+INTERVALS = [60, 300, 900, 3600, 86400]
+CRONS = ['*/5 * * * *', '0 9-17 * * 1-5', '30 6 * * *', '0 */2 * * *']
+
+
+def build_schedules(n):
+    schedules = []
+    for i in range(n):
+        schedule = {'id': i, 'target': f'device{i}', 'opt': True, 'duration': random.choice(INTERVALS)}
+        if i % 10 == 0:
+            schedule['cron'] = random.choice(CRONS)
+        elif i % 3 == 0:
+            schedule['align'] = 1
+        schedules.append(schedule)
+    return schedules
+
+
+def scan(schedule_list, duration):
+    # previous ScheduleService.do_schedule, a full pass over the list per tick
+    return [s for s in schedule_list if s['duration'] == duration]
+
+
+def run(n, hours):
+    schedules = build_schedules(n)
+    scheduler = Scheduler(lambda schedule, due: None)
+    now = time.time()
+    begin = time.perf_counter()
+    scheduler.sync(schedules, now)
+    build = time.perf_counter() - begin
+
+    fired = 0
+    begin = time.perf_counter()
+    for minute in range(1, hours * 60 + 1):
+        fired += len(scheduler.pop_due(now + minute * 60))
+    elapsed = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    for _ in range(60):
+        scan(schedules, 60)
+    per_scan = (time.perf_counter() - begin) / 60
+
+    print(f'{n} schedules, {hours} h simulated, heap built in {build * 1e3:.0f} ms')
+    print(f'  heap : {fired} fires, {elapsed / fired * 1e6:6.2f} us/fire, {elapsed / (hours * 60) * 1e3:7.2f} ms/minute')
+    print(f'  scan : {per_scan * 1e3:7.2f} ms per tick and interval, only 60/3600/86400 supported')
+
+
+if __name__ == '__main__':
+    random.seed(1)
+    run(100000, 2)
@@ -0,0 +1,59 @@
+import random
+import timeit
+
+import message_broker.channels as mb_channel
+from common.topic import TopicTrie
+
+
+def linear_match(topic_list, curr_topic):
+    # previous MQTTClient._topic_match verbatim, kept as the baseline
+    match_list = []
+    for register_topic in topic_list:
+        curr_path = curr_topic.split('/')
+        register_path = register_topic.split('/')
+        match = True
+        for index in range(len(register_path)):
+            rp = register_path[index]
+            if rp == '#':  # multi level match
+                break
+            if rp == '+':  # single level match
+                continue
+            cp = curr_path[index]
+            if cp != rp:  # not match
+                match = False
+                break
+        if match:
+            match_list.append(register_topic)
+
+    return match_list
+
+
+def build_topics(n):
+    topics = [mb_channel.DEVICE_DATA + '+', mb_channel.STORAGE_DATA + '#']
+    for i in range(n - len(topics)):
+        topics.append(mb_channel.DEVICE_COMMAND + f'device{i}')
+    return topics
+
+
+def run(n, rounds=1000):
+    topics = build_topics(n)
+    trie = TopicTrie()
+    for topic in topics:
+        trie.insert(topic)
+    messages = [mb_channel.DEVICE_DATA + 'temperature',
+                mb_channel.STORAGE_DATA + 'humidity',
+                mb_channel.DEVICE_COMMAND + f'device{random.randrange(max(n - 2, 1))}']
+
+    for msg in messages:
+        assert sorted(trie.match(msg)) == sorted(linear_match(topics, msg)), msg
+
+    linear = timeit.timeit(lambda: [linear_match(topics, m) for m in messages], number=rounds)
+    tree = timeit.timeit(lambda: [trie.match(m) for m in messages], number=rounds)
+    count = rounds * len(messages)
+    print(f'{n:>6} subscriptions: linear {linear / count * 1e6:10.2f} us/msg, '
+          f'trie {tree / count * 1e6:6.2f} us/msg, speedup x{linear / tree:.1f}')
+
+
+if __name__ == '__main__':
+    for size, r in ((10, 10000), (1000, 200), (10000, 20)):
+        run(size, r)
@@ -3,13 +3,14 @@ import requests
 import threading
 import constants.entity
 import constants.http as const_h
+from common.command import CommandPublisher
 from common.log import Logger
 from common.mqtt import MQTTClient
 from common.http_client import HTTPClient
 
 
 class BaseService:
-    def __init__(self, name):
+    def __init__(self, name, command_window=60.0):
         self.service_name = name
         self.mqtt_broker = None
         self.mqtt_port = None
@@ -20,17 +21,19 @@ class BaseService:
         self.http_client = None
         self.register_url = f'{const_h.MYSQL_HOST}:{const_h.SERVICE_PORT_MYSQL}{const_h.MYSQL_SERVICE_REGISTER}'
         self.logger = Logger()
+        # device commands, a repeated command within command_window seconds is suppressed (0 disables it)
+        self.command_publisher = CommandPublisher(self.mqtt_publish, window=command_window)
 
     def start(self):
         threading.Thread(target=self._heart_beat).start()
 
-    def init_mqtt_client(self, broker="43.131.48.203", port=1883):
+    def init_mqtt_client(self, broker="43.131.48.203", port=1883, workers=0):
         if self.mqtt_client is not None:
             return
 
         self.mqtt_broker = broker
         self.mqtt_port = port
-        self.mqtt_client = MQTTClient(self.service_name, broker, port)
+        self.mqtt_client = MQTTClient(self.service_name, broker, port, workers=workers)
         self.mqtt_client.start()
 
     def remove_mqtt_client(self):
@@ -54,6 +57,20 @@ class BaseService:
         self.mqtt_client.publish(topic, message)
         return True, ""
 
+    def publish_command(self, target, message, force=False):
+        # returns False when the command repeats the last state of the target and is suppressed,
+        # or was not published; force for commands a user sends on purpose
+        return self.command_publisher.publish(target, message, force)
+
+    def command_stats(self):
+        return self.command_publisher.stats()
+
+    def mqtt_stats(self):
+        if self.mqtt_client is None:
+            return {}
+
+        return self.mqtt_client.stats()
+
     def init_http_client(self, host="localhost", port=8080):
         if self.http_client is not None:
             return
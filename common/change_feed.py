@@ -0,0 +1,41 @@
+import threading
+
+import requests
+
+from common.log import Logger
+
+
+class ChangeFeed:
+    """
+    Rows of a mysql table followed by version: one full load, then only the rows changed since the
+    newest updated_at seen, every `interval` seconds or right after notify() (change notification).
+    apply(rows, full) gets the rows, deleted ones included when not full.
+    """
+    def __init__(self, name, url, apply, interval=30, params=None):
+        self.url = url
+        self.apply = apply
+        self.interval = interval
+        self.params = params or {}
+        self.version = None  # updated_at of the newest row loaded
+        self.event = threading.Event()
+        self.logger = Logger(prefix=f'{name} changes:')
+
+    def notify(self):
+        self.event.set()
+
+    def fetch(self):
+        params = dict(self.params, since=self.version or '')
+        resp = requests.get(self.url, params)
+        resp.raise_for_status()
+        resp_data = resp.json()
+        self.apply(resp_data['list'], self.version is None)
+        self.version = resp_data['version']
+
+    def run(self):
+        while True:
+            try:
+                self.fetch()
+            except Exception as e:
+                self.logger.error(f'fetch changes failed: {e}')
+            self.event.wait(self.interval)
+            self.event.clear()
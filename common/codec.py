@@ -0,0 +1,88 @@
+import json
+
+try:
+    import msgpack
+except ImportError:  # binary encoding not available, everything stays json
+    msgpack = None
+
+# payload format is told by the first byte: json text starts with '{' or '[',
+# any other format is a marker byte followed by the encoded message
+CODEC_JSON = 'json'
+CODEC_MSGPACK = 'msgpack'
+MARKER_MSGPACK = b'\x01'
+# optional header in front of any format: marker, name length, utf-8 device name,
+# lets a forwarder check the sender without decoding the message
+MARKER_DEVICE = b'\x02'
+
+
+class Codec:
+    def __init__(self, name, marker, dumps, loads):
+        self.name = name
+        self.marker = marker  # None for json, sent without marker
+        self.dumps = dumps  # obj -> bytes
+        self.loads = loads  # bytes -> obj
+
+
+_codecs = {}  # name -> Codec
+_markers = {}  # marker byte -> Codec
+
+
+def register_codec(name, marker, dumps, loads):
+    codec = Codec(name, marker, dumps, loads)
+    _codecs[name] = codec
+    if marker is not None:
+        _markers[marker[0]] = codec
+
+
+def available(name):
+    return name in _codecs
+
+
+def encode(obj, codec=CODEC_JSON):
+    # unknown or missing codec falls back to json, every receiver can read it
+    c = _codecs.get(codec, _codecs[CODEC_JSON])
+    if c.marker is None:
+        return c.dumps(obj)
+    return c.marker + c.dumps(obj)
+
+
+def with_device(payload, device):
+    name = device.encode('utf-8')
+    if len(name) > 255:
+        return payload
+    return MARKER_DEVICE + bytes([len(name)]) + name + payload
+
+
+def peek_device(payload):
+    # device name of the header, None when the payload has no header
+    if isinstance(payload, str) or payload[:1] != MARKER_DEVICE or len(payload) < 2:
+        return None
+    return bytes(payload[2:2 + payload[1]]).decode('utf-8')
+
+
+def decode(payload):
+    if isinstance(payload, str):
+        return json.loads(payload)
+    if payload[:1] == MARKER_DEVICE:
+        return decode(payload[2 + payload[1]:])
+    if len(payload) > 0 and payload[0] in _markers:
+        return _markers[payload[0]].loads(payload[1:])
+    return json.loads(payload.decode('utf-8'))
+
+
+def decode_device(payload):
+    # decoded message, None when its header names another device than tags.device: the auth service
+    # only checks the header, so the identity the data is stored and matched under must be the same
+    data_dict = decode(payload)
+    name = peek_device(payload)
+    if name is None:
+        return data_dict
+    tags = data_dict.get('tags') if isinstance(data_dict, dict) else None
+    if not isinstance(tags, dict) or tags.get('device') != name:
+        return None
+    return data_dict
+
+
+register_codec(CODEC_JSON, None, lambda obj: json.dumps(obj).encode('utf-8'), lambda data: json.loads(data))
+if msgpack is not None:
+    register_codec(CODEC_MSGPACK, MARKER_MSGPACK, msgpack.packb, msgpack.unpackb)
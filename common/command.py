@@ -0,0 +1,97 @@
+import threading
+import time
+
+import message_broker.channels as mb_channel
+from common.log import Logger
+
+
+class CommandPublisher:
+    """
+    Publishes device commands and keeps the last commanded state per target. A command equal to
+    the last one sent to the same target within `window` seconds is suppressed; with `coalesce` > 0
+    the commands of a target are held that many seconds and only the last of a burst is sent.
+    """
+    def __init__(self, publish, channel=mb_channel.DEVICE_COMMAND, window=60.0, coalesce=0.0, report=300.0):
+        self.publish_func = publish  # publish(topic, message)
+        self.channel = channel
+        self.window = window
+        self.coalesce = coalesce
+        self.report = report
+        self.lock = threading.Lock()
+        self.last = {}  # target -> (message, monotonic time sent)
+        self.pending = {}  # target -> message waiting for the coalesce delay
+        self.logger = Logger(prefix='command publisher:')
+        # counters
+        self.sent = 0
+        self.suppressed = 0
+        self.merged = 0
+        self.reported_at = time.monotonic()
+
+    def publish(self, target, message, force=False):
+        # returns False when the command is suppressed or not published, force skips suppression and coalescing
+        if self.coalesce > 0 and force is False:
+            with self.lock:
+                if target in self.pending:
+                    self.merged += 1
+                else:
+                    threading.Timer(self.coalesce, self._flush, (target,)).start()
+                self.pending[target] = message
+            return True
+
+        if force:
+            with self.lock:
+                self.pending.pop(target, None)
+        return self._send(target, message, force)
+
+    def _flush(self, target):
+        with self.lock:
+            message = self.pending.pop(target, None)
+        if message is not None:
+            self._send(target, message, False)
+
+    def _send(self, target, message, force):
+        now = time.monotonic()
+        with self.lock:
+            last = self.last.get(target)
+            if force is False and last is not None and last[0] == message and now - last[1] < self.window:
+                self.suppressed += 1
+                self._report(now)
+                return False
+            self.last[target] = (message, now)
+            self.sent += 1
+            self._report(now)
+
+        try:
+            result = self.publish_func(self.channel + target, message)
+        except Exception:
+            self._undo(target, message, now)
+            raise
+        if isinstance(result, tuple) and result[0] is False:  # BaseService.mqtt_publish without a client
+            self._undo(target, message, now)
+            return False
+        return True
+
+    def _undo(self, target, message, now):
+        # not delivered, the next equal command must not be suppressed
+        with self.lock:
+            if self.last.get(target) == (message, now):
+                del self.last[target]
+                self.sent -= 1
+
+    def _report(self, now):
+        if self.report <= 0 or now - self.reported_at < self.report:
+            return
+        self.reported_at = now
+        self.logger.info(f'sent: {self.sent}, suppressed: {self.suppressed}, merged: {self.merged}')
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sent': self.sent,
+                'suppressed': self.suppressed,
+                'merged': self.merged,
+                'pending': len(self.pending),
+                'targets': len(self.last),
+                'window': self.window,
+                'coalesce': self.coalesce,
+            }
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+import zlib
+from common.log import Logger
+
+# full queue policy
+POLICY_BLOCK = "block"  # wait for space, back pressure on the caller
+POLICY_DROP_NEW = "drop_new"  # drop the incoming message
+POLICY_DROP_OLD = "drop_old"  # drop the oldest queued message
+
+_STOP = object()
+
+
+class Dispatcher:
+    """
+    Bounded worker pool, tasks with the same key always run on the same worker so their order is kept.
+    """
+    def __init__(self, name, workers=4, queue_size=1000, policy=POLICY_BLOCK):
+        if policy not in (POLICY_BLOCK, POLICY_DROP_NEW, POLICY_DROP_OLD):
+            raise ValueError(f'unknown dispatch policy: {policy}')
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.policy = policy
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads = []
+        self.running = False
+        self.logger = Logger(prefix=f'dispatcher {name}:')
+        # counters
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.handled = 0
+        self.dropped = 0
+        self.failed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.wait_total = 0.0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        for index in range(self.workers):
+            t = threading.Thread(target=self._worker, args=(self.queues[index],), daemon=True,
+                                 name=f'{self.name}-worker-{index}')
+            t.start()
+            self.threads.append(t)
+
+    def stop(self, timeout=None):
+        if self.running is False:
+            return
+        self.running = False
+        for q in self.queues:
+            q.put(_STOP)  # queued tasks are drained first
+        for t in self.threads:
+            t.join(timeout)
+        self.threads = []
+
+    def submit(self, key, func, *args):
+        q = self.queues[zlib.crc32(key.encode('utf-8')) % self.workers]
+        task = (func, args, time.monotonic())
+        with self.lock:
+            self.submitted += 1
+
+        if self.policy == POLICY_BLOCK:
+            q.put(task)
+            return True
+
+        while True:
+            try:
+                q.put_nowait(task)
+                return True
+            except queue.Full:
+                pass
+            if self.policy == POLICY_DROP_NEW:
+                self._drop(key)
+                return False
+            try:  # make room by discarding the oldest task
+                q.get_nowait()
+                self._drop(key)
+            except queue.Empty:
+                pass
+
+    def queue_depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def stats(self):
+        with self.lock:
+            avg = self.latency_total / self.handled if self.handled > 0 else 0.0
+            wait = self.wait_total / self.handled if self.handled > 0 else 0.0
+            return {
+                'workers': self.workers,
+                'queue_depth': self.queue_depth(),
+                'queue_size': self.queue_size * self.workers,
+                'submitted': self.submitted,
+                'handled': self.handled,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'latency_avg_ms': round(avg * 1000, 3),
+                'latency_max_ms': round(self.latency_max * 1000, 3),
+                'wait_avg_ms': round(wait * 1000, 3),
+            }
+
+    def _drop(self, key):
+        with self.lock:
+            self.dropped += 1
+            dropped = self.dropped
+        if dropped % 1000 == 1:
+            self.logger.warning(f'queue full, key: {key}, dropped {dropped} messages')
+
+    def _worker(self, q):
+        while True:
+            task = q.get()
+            if task is _STOP:
+                return
+            func, args, enqueued = task
+            begin = time.monotonic()
+            failed = False
+            try:
+                func(*args)
+            except Exception as e:
+                failed = True
+                self.logger.error(f'handler error: {e}')
+            cost = time.monotonic() - begin
+            with self.lock:
+                self.handled += 1
+                if failed:
+                    self.failed += 1
+                self.latency_total += cost
+                self.wait_total += begin - enqueued
+                if cost > self.latency_max:
+                    self.latency_max = cost
@@ -1,14 +1,21 @@
 import paho.mqtt.client as mqtt_client
+from common.topic import TopicTrie
+from common.dispatcher import Dispatcher, POLICY_BLOCK
 
 
 class MQTTClient:
-    def __init__(self, client_id, broker, port):
+    def __init__(self, client_id, broker, port, workers=0, queue_size=1000, policy=POLICY_BLOCK):
         self.broker = broker
         self.port = port
         self.client_id = client_id
         self.is_subscriber = False
         self.topics = []
         self.topic_handlers = {}
+        self.topic_trie = TopicTrie()  # built at subscribe time
+        # handlers run on a worker pool instead of the network loop when workers > 0
+        self.dispatcher = None
+        if workers > 0:
+            self.dispatcher = Dispatcher(client_id, workers, queue_size, policy)
 
         # init mqtt client
         self.client = mqtt_client.Client(client_id, False)
@@ -19,6 +26,8 @@ class MQTTClient:
     def start(self):
         self.client.connect(self.broker, self.port, keepalive=60)
         self.client.reconnect_delay_set(min_delay=1, max_delay=120)
+        if self.dispatcher is not None:
+            self.dispatcher.start()
         self.client.loop_start()
 
     def stop(self):
@@ -27,9 +36,12 @@ class MQTTClient:
                 self.client.unsubscribe(topic)
         self.is_subscriber = False
         self.topics = []
+        self.topic_trie.clear()
 
         self.client.loop_stop()
         self.client.disconnect()
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
 
     def publish(self, topic, msg):
         self.client.publish(topic, msg)
@@ -38,6 +50,7 @@ class MQTTClient:
         self.is_subscriber = True
         self.topics.append(topic)
         self.topic_handlers[topic] = handler
+        self.topic_trie.insert(topic)
 
         self.client.subscribe(topic, 2)
 
@@ -50,26 +63,21 @@ class MQTTClient:
             print(f"topic {msg.topic} no match callback")
             return
 
+        if self.dispatcher is not None:
+            # same topic goes to the same worker, keep message order per topic
+            self.dispatcher.submit(msg.topic, self._dispatch, match_list, client, userdata, msg)
+            return
+
+        self._dispatch(match_list, client, userdata, msg)
+
+    def _dispatch(self, match_list, client, userdata, msg):
         for register_topic in match_list:
             self.topic_handlers[register_topic](client, userdata, msg)
 
-    def _topic_match(self, curr_topic):
-        match_list = []
-        for register_topic in self.topic_handlers.keys():
-            curr_path = curr_topic.split('/')
-            register_path = register_topic.split('/')
-            match = True
-            for index in range(len(register_path)):
-                rp = register_path[index]
-                if rp == '#':  # multi level match
-                    break
-                if rp == '+':  # single level match
-                    continue
-                cp = curr_path[index]
-                if cp != rp:  # not match
-                    match = False
-                    break
-            if match:
-                match_list.append(register_topic)
+    def stats(self):
+        if self.dispatcher is None:
+            return {}
+        return self.dispatcher.stats()
 
-        return match_list
+    def _topic_match(self, curr_topic):
+        return self.topic_trie.match(curr_topic)
@@ -0,0 +1,23 @@
+# batch envelope on the device data channel:
+# {"tags": {...}, "samples": [{"fields": {...}, "time": epoch nanoseconds}, ...]}
+# a single sample keeps the original format: {"tags": {...}, "fields": {...}}
+SAMPLES = 'samples'
+
+
+def batch_message(tags, samples):
+    # samples: list of (fields, epoch nanoseconds)
+    return {
+        'tags': tags,
+        SAMPLES: [{'fields': fields, 'time': at} for fields, at in samples],
+    }
+
+
+def is_batch(data_dict):
+    return SAMPLES in data_dict
+
+
+def get_samples(data_dict):
+    # list of (fields, epoch nanoseconds or None) for both formats
+    if is_batch(data_dict) is False:
+        return [(data_dict['fields'], None)]
+    return [(sample['fields'], sample.get('time')) for sample in data_dict[SAMPLES]]
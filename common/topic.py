@@ -0,0 +1,83 @@
+SINGLE_LEVEL = '+'
+MULTI_LEVEL = '#'
+SEPARATOR = '/'
+
+
+class _Node:
+    __slots__ = ('children', 'topics')
+
+    def __init__(self):
+        self.children = {}  # level -> _Node
+        self.topics = []  # registered topics ending at this node
+
+
+class TopicTrie:
+    """
+    Topic filters split by level, so a match walks the topic depth instead of every filter.
+    """
+    def __init__(self):
+        self.root = _Node()
+        self.size = 0
+
+    def insert(self, topic):
+        node = self.root
+        for level in topic.split(SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                child = _Node()
+                node.children[level] = child
+            node = child
+        if topic in node.topics:
+            return
+        node.topics.append(topic)
+        self.size += 1
+
+    def remove(self, topic):
+        path = [self.root]
+        levels = topic.split(SEPARATOR)
+        for level in levels:
+            child = path[-1].children.get(level)
+            if child is None:
+                return
+            path.append(child)
+        if topic not in path[-1].topics:
+            return
+        path[-1].topics.remove(topic)
+        self.size -= 1
+        # prune empty branches
+        for index in range(len(levels), 0, -1):
+            node = path[index]
+            if node.children or node.topics:
+                break
+            del path[index - 1].children[levels[index - 1]]
+
+    def clear(self):
+        self.root = _Node()
+        self.size = 0
+
+    def match(self, curr_topic):
+        levels = curr_topic.split(SEPARATOR)
+        match_list = []
+        # topics starting with '$' are not matched by a leading wildcard
+        skip_wildcard = curr_topic.startswith('$')
+        self._match(self.root, levels, 0, match_list, skip_wildcard)
+
+        return match_list
+
+    def _match(self, node, levels, index, match_list, skip_wildcard=False):
+        if not skip_wildcard:
+            multi = node.children.get(MULTI_LEVEL)
+            if multi is not None:  # '#' also matches the parent level
+                match_list.extend(multi.topics)
+
+        if index == len(levels):
+            match_list.extend(node.topics)
+            return
+
+        child = node.children.get(levels[index])
+        if child is not None:
+            self._match(child, levels, index + 1, match_list)
+        if not skip_wildcard:
+            single = node.children.get(SINGLE_LEVEL)
+            if single is not None:
+                self._match(single, levels, index + 1, match_list)
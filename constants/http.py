@@ -24,11 +24,16 @@ INFLUX_BASE_ROUTE = '/influx/'
 INFLUX_MEASUREMENT_LIST = INFLUX_BASE_ROUTE + "measurement"
 INFLUX_DATA_GET = INFLUX_BASE_ROUTE + "data"
 INFLUX_DATA_COUNT = INFLUX_BASE_ROUTE + "data/count"
+INFLUX_DATA_LATEST = INFLUX_BASE_ROUTE + "latest"  # newest value per area, measurement and device
+INFLUX_DATA_AGGREGATE = INFLUX_BASE_ROUTE + "data/aggregate"  # windowed aggregation
+INFLUX_DATA_SNAPSHOT = INFLUX_BASE_ROUTE + "data/snapshot"  # newest stored value per area and measurement
 INFLUX_OPERATION_GET = INFLUX_BASE_ROUTE + "operation"
+INFLUX_STATUS = INFLUX_BASE_ROUTE + "status"  # write pipeline and spool status
 # mysql
 MYSQL_BASE_ROUTE = '/mysql/'
 MYSQL_DEVICE_LIST = MYSQL_BASE_ROUTE + entity.DEVICE_TABLE  # get device list
 MYSQL_DEVICE_CERTIFIED_LIST = MYSQL_BASE_ROUTE + entity.DEVICE_TABLE + '/certified'  # get certified device list
+MYSQL_DEVICE_CERTIFIED_VERSION = MYSQL_BASE_ROUTE + entity.DEVICE_TABLE + '/certified/version'  # certified list version
 MYSQL_DEVICE_APPROVE = MYSQL_BASE_ROUTE + entity.DEVICE_TABLE + '/approve'  # approve device
 MYSQL_DEVICE_RUNNING = MYSQL_BASE_ROUTE + entity.DEVICE_TABLE + '/running'  # change device running status
 MYSQL_DEVICE_REGISTER = MYSQL_BASE_ROUTE + entity.DEVICE_TABLE + '/register'  # register device
@@ -42,10 +47,12 @@ MYSQL_RULE_LIST = MYSQL_BASE_ROUTE + entity.RULE_TABLE  # get rule list
 MYSQL_RULE_COUNT = MYSQL_BASE_ROUTE + entity.RULE_TABLE + '/count'  # get amount of rules
 MYSQL_RULE_SAVE = MYSQL_BASE_ROUTE + entity.RULE_TABLE + '/save'  # save rule list
 MYSQL_RULE_RUNNING = MYSQL_BASE_ROUTE + entity.RULE_TABLE + '/running'  # change rule running status
+MYSQL_RULE_CHANGES = MYSQL_BASE_ROUTE + entity.RULE_TABLE + '/changes'  # rules changed since a version
 MYSQL_SCHEDULE_LIST = MYSQL_BASE_ROUTE + entity.SCHEDULE_TABLE  # get schedule list
 MYSQL_SCHEDULE_COUNT = MYSQL_BASE_ROUTE + entity.SCHEDULE_TABLE + '/count'  # get amount of schedules
 MYSQL_SCHEDULE_SAVE = MYSQL_BASE_ROUTE + entity.SCHEDULE_TABLE + '/save'  # save schedule list
 MYSQL_SCHEDULE_RUNNING = MYSQL_BASE_ROUTE + entity.SCHEDULE_TABLE + '/running'  # change schedule running status
+MYSQL_SCHEDULE_STATE = MYSQL_BASE_ROUTE + entity.SCHEDULE_TABLE + '/state'  # get or save schedule fire times
 MYSQL_AREA_LIST = MYSQL_BASE_ROUTE + entity.AREA_TABLE
 MYSQL_AREA_SAVE = MYSQL_BASE_ROUTE + entity.AREA_TABLE + '/save'
 # user
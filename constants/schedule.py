@@ -0,0 +1,6 @@
+# catch up, what a schedule does with the fires it missed (service down, clock change)
+CATCH_UP_SKIP = "skip"  # drop them, wait for the next regular fire
+CATCH_UP_ONCE = "once"  # fire once right away
+CATCH_UP_ALL = "all"  # fire every missed run, at most MAX_CATCH_UP
+CATCH_UP_POLICIES = [CATCH_UP_SKIP, CATCH_UP_ONCE, CATCH_UP_ALL]
+MAX_CATCH_UP = 100
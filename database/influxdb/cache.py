@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    LRU cache of query responses with a short ttl, concurrent requests for the same key share one query.
+    Entries of a measurement are dropped when new points of it are written.
+    """
+    def __init__(self, max_size=256, ttl=5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires at, measurement, response)
+        self.flights = {}  # key -> Flight of the running query
+        self.generation = {}  # measurement -> invalidation count, a response loaded before is not stored
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def get(self, measurement, key, load):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = Flight()
+                self.flights[key] = flight
+                generation = self.generation.get(measurement, 0)
+            else:
+                self.coalesced += 1
+
+        if leader is False:  # same query already running
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = load()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+                cacheable = flight.error is None and 'code' not in flight.result
+                if cacheable and self.generation.get(measurement, 0) == generation:
+                    self.entries[key] = (time.monotonic() + self.ttl, measurement, flight.result)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_size:
+                        self.entries.popitem(last=False)
+            flight.done.set()
+        return flight.result
+
+    def invalidate(self, measurement):
+        with self.lock:
+            self.generation[measurement] = self.generation.get(measurement, 0) + 1
+            keys = [key for key, entry in self.entries.items() if entry[1] == measurement]
+            for key in keys:
+                del self.entries[key]
+            self.invalidations += len(keys)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'invalidations': self.invalidations,
+            }
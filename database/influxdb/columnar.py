@@ -0,0 +1,145 @@
+import numpy as np
+import pytz
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+# csv columns that are not returned
+SKIP_COLUMNS = {'', 'result', 'table', '_start', '_stop', '_time', '_value'}
+MICROSECOND = timedelta(microseconds=1)
+CHUNK_SIZE = 2048
+
+_tz_cache = {}
+
+
+class ColumnBuilder:
+    """
+    Columns built chunk by chunk from flux csv rows: time as int64 epoch, values as float64, tags dictionary encoded.
+    Only the arrays are kept, the csv strings of a chunk are released once it is converted.
+    """
+    def __init__(self):
+        self.size = 0
+        self.times = []  # int64 epoch microseconds per chunk
+        self.values = []  # float64 (or str when not numeric) per chunk
+        self.tags = {}  # name -> (dictionary {value: code}, list of int32 codes per chunk)
+
+    def add(self, header, rows):
+        if len(rows) == 0:
+            return
+        tag_names = [name for name in header if name not in SKIP_COLUMNS]
+        picker = itemgetter(header.index('_time'), header.index('_value'), *[header.index(n) for n in tag_names])
+        columns = list(zip(*map(picker, rows)))
+
+        self.times.append(parse_time(columns[0]))
+        self.values.append(parse_value(columns[1]))
+        for name, column in zip(tag_names, columns[2:]):
+            self._add_tag(name, column, len(rows))
+        for name in self.tags:
+            if name not in tag_names:  # tag missing in this table
+                self._add_tag(name, ('',) * len(rows), len(rows))
+        self.size += len(rows)
+
+    def _add_tag(self, name, column, n):
+        if name not in self.tags:
+            dictionary = {}
+            chunks = []
+            if self.size > 0:
+                dictionary[''] = 0
+                chunks.append(np.zeros(self.size, dtype=np.int32))
+            self.tags[name] = (dictionary, chunks)
+        dictionary, chunks = self.tags[name]
+        uniques, inverse = np.unique(np.array(column, dtype=str), return_inverse=True)
+        mapping = np.array([dictionary.setdefault(value, len(dictionary)) for value in uniques.tolist()],
+                           dtype=np.int32)
+        chunks.append(mapping[inverse.reshape(n)])
+
+    def build(self, tz=None):
+        result = {
+            'size': self.size,
+            'time': [],
+            'value': [],
+            'tags': {},
+        }
+        if self.size == 0:
+            return result
+
+        utc_us = np.concatenate(self.times)
+        result['time'] = (utc_us // 1000).tolist()
+        if tz is not None:
+            result['utc_offset'] = offset_runs(tz_offsets(utc_us, tz))
+        for chunk in self.values:
+            result['value'].extend(chunk.tolist() if isinstance(chunk, np.ndarray) else chunk)
+        for name, (dictionary, chunks) in self.tags.items():
+            result['tags'][name.removeprefix('_')] = {
+                'values': list(dictionary.keys()),
+                'codes': np.concatenate(chunks).tolist(),
+            }
+        return result
+
+
+def build_columns(rows, tz=None):
+    """
+    Build columns from flux csv rows, header row first and an empty row before each new table header.
+    """
+    builder = ColumnBuilder()
+    header = None
+    chunk = []
+    for row in rows:
+        if len(row) == 0 or row[0].startswith('#'):
+            if len(row) == 0 and header is not None:
+                builder.add(header, chunk)
+                header, chunk = None, []
+            continue
+        if header is None:
+            header = row
+            continue
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            builder.add(header, chunk)
+            chunk = []
+    if header is not None:
+        builder.add(header, chunk)
+
+    return builder.build(tz)
+
+
+def parse_time(time_list):
+    # RFC3339 in UTC, 'Z' removed so numpy parses it without timezone handling
+    times = np.array([t[:-1] if t.endswith('Z') else t for t in time_list], dtype='datetime64[ns]')
+    return times.astype(np.int64) // 1000
+
+
+def parse_value(value_list):
+    try:
+        return np.array(value_list, dtype=np.float64)
+    except ValueError:
+        return list(value_list)
+
+
+def offset_runs(offsets_us):
+    # utc offset in milliseconds from row index[i] on, it only changes at the zone transitions,
+    # local time is time + offset instead of one formatted string per row
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(offsets_us)) + 1))
+    return {
+        'index': starts.tolist(),
+        'offset': (offsets_us[starts] // 1000).tolist(),
+    }
+
+
+def tz_offsets(utc_us, tz_name):
+    # utc offset of each timestamp from the zone transition table, one searchsorted for all rows
+    if tz_name not in _tz_cache:
+        zone = pytz.timezone(tz_name)
+        transitions = getattr(zone, '_utc_transition_times', None)
+        if transitions is None:
+            offset = zone.utcoffset(datetime(2000, 1, 1)) // MICROSECOND
+            _tz_cache[tz_name] = (np.array([np.iinfo(np.int64).min], dtype=np.int64),
+                                  np.array([offset], dtype=np.int64))
+        else:
+            times = np.array(transitions, dtype='datetime64[us]').astype(np.int64)
+            times[0] = np.iinfo(np.int64).min  # first entry stands for the beginning of time
+            offsets = np.array([info[0] // MICROSECOND for info in zone._transition_info], dtype=np.int64)
+            _tz_cache[tz_name] = (times, offsets)
+
+    times, offsets = _tz_cache[tz_name]
+    index = np.searchsorted(times, utc_us, side='right') - 1
+    return offsets[np.clip(index, 0, len(offsets) - 1)]
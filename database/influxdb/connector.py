@@ -1,74 +1,200 @@
+import time
+import json
+import base64
+from datetime import datetime, timedelta, timezone
 from common.time import time_to_str
+from common.log import Logger
+from database.influxdb.columnar import build_columns
+from database.influxdb.query import (AGGREGATE_RANGE, SNAPSHOT_RANGE, QueryFilter, page_query, after_query,
+                                     aggregate_query, snapshot_query, count_query, count_by_day_query)
+from database.influxdb.spool import Spool
+from database.influxdb.writer import BatchWriter, is_rejected
 
-from influxdb_client import InfluxDBClient, Point
+from influxdb_client import InfluxDBClient, Point, WritePrecision, Dialect
 from influxdb_client.client.write_api import SYNCHRONOUS
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+CSV_DIALECT = Dialect(header=True, annotations=[])
+MICROSECOND = timedelta(microseconds=1)
+MILLISECOND = timedelta(milliseconds=1)
+
 
 class Connector:
-    def __init__(self, url, token, org, bucket):
+    def __init__(self, url, token, org, bucket, batch_size=0, flush_interval=1.0, buffer_size=10000,
+                 spool_dir=None):
         self.url = url
         self.token = token
         self.org = org
         self.bucket = bucket
         self.client = InfluxDBClient(url=url, token=token, org=org)
+        self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
+        self.logger = Logger(prefix=f'influx connector {bucket}:')
+        self.written_listeners = []  # func(lines), called once lines are stored in the database
+        # failed points are kept on disk and replayed after recovery
+        self.spool = None
+        if spool_dir is not None:
+            self.spool = Spool(bucket, spool_dir)
+            self.spool.start(self.write_lines)
+        # batch_size = 0 keeps the synchronous write per point
+        self.writer = None
+        if batch_size > 0:
+            fallback = self.spool.append if self.spool is not None else None
+            self.writer = BatchWriter(bucket, self.write_lines, batch_size=batch_size,
+                                      flush_interval=flush_interval, buffer_size=buffer_size,
+                                      fallback=fallback)
+            self.writer.start()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.spool is not None:
+            self.spool.stop()
+        self.client.close()
+
+    def flush(self, timeout=None):
+        if self.writer is None:
+            return True
+        return self.writer.flush(timeout)
 
     def insert(self, measurement, tags, fields):
-        write_api = self.client.write_api(write_options=SYNCHRONOUS)
-        point = Point(measurement)
-        for key, value in tags.items():
-            point = point.tag(key, value)
-        for key, value in fields.items():
-            point = point.field(key, value)
+        self.insert_many(measurement, tags, [(fields, None)])
+
+    def insert_many(self, measurement, tags, samples):
+        # samples: list of (fields, epoch nanoseconds or None), written together
+        received_at = time.time_ns()
+        lines = []
+        for fields, at in samples:
+            point = Point(measurement)
+            for key, value in tags.items():
+                point = point.tag(key, value)
+            for key, value in fields.items():
+                point = point.field(key, value)
+            # point may be written later, keep the time it was received (or measured),
+            # rounded to microseconds so the time read back can be used as an exact cursor
+            point = point.time((at if at is not None else received_at) // 1000 * 1000, WritePrecision.NS)
+            lines.append(point.to_line_protocol())
+
+        if self.writer is not None:
+            self.writer.add_many(lines)
+            return
+
+        try:
+            self.write_lines(lines)
+        except Exception as e:
+            if self.spool is None or is_rejected(e):
+                raise
+            self.logger.warning(f'write failed, spool {len(lines)} points: {e}')
+            self.spool.append(lines)
+
+    def write_lines(self, lines):
+        # every write goes through here: synchronous, batch writer and spool replay
+        self.write_api.write(bucket=self.bucket, record=lines, write_precision=WritePrecision.NS)
+        for listener in self.written_listeners:
+            try:
+                listener(lines)
+            except Exception as e:
+                self.logger.error(f'written listener failed: {e}')
+
+    def add_written_listener(self, func):
+        self.written_listeners.append(func)
+
+    def write_stats(self):
+        result = {}
+        if self.writer is not None:
+            result['writer'] = self.writer.stats()
+        if self.spool is not None:
+            result['spool'] = self.spool.stats()
+        return result
 
-        write_api.write(bucket=self.bucket, record=point)
+    def query(self, query_filter, page=1, size=10):
+        sql, params = self._page_sql(query_filter, page, size)
 
-    def query(self, measurement, time_range=None, cond=None, page=1, size=10):
-        if time_range is None:
-            time_range = "start: -120m"
+        tables = self.client.query_api().query(sql, org=self.org, params=params)
+        result = []
+        for table in tables:
+            for record in table.records:
+                result.append(record_line(record))
+        return result
+
+    def query_columns(self, query_filter, page=1, size=10, tz=None):
+        # same query as query(), columns are built straight from the csv rows without FluxRecord
+        sql, params = self._page_sql(query_filter, page, size)
+        rows = self.client.query_api().query_csv(sql, org=self.org, dialect=CSV_DIALECT, params=params)
+        return build_columns(rows, tz)
+
+    def _page_sql(self, query_filter, page, size):
+        params = query_filter.params()
+        params['size'] = size
+        params['offset'] = (page-1)*size
+        return page_query(self.bucket, query_filter.shape()), params
+
+    def query_after(self, query_filter, cursor=None, size=10):
+        # keyset pagination: continue after the cursor instead of skipping offset rows
+        params = query_filter.params()
+        params['size'] = size
+        if cursor is not None:
+            last_time, device, field = decode_cursor(cursor)
+            # range stop is exclusive, rows at the cursor time are picked by the tie breaker
+            params['stop'] = min(params['stop'], last_time + MICROSECOND)
+            params['cursor_time'] = last_time
+            params['cursor_device'] = device
+            params['cursor_field'] = field
+
+        sql = after_query(self.bucket, query_filter.shape(), cursor is not None)
+        tables = self.client.query_api().query(sql, org=self.org, params=params)
+        result = []
+        last = None
+        for table in tables:
+            for record in table.records:
+                result.append(record_line(record))
+                last = record
 
-        offset = (page-1)*size
+        next_cursor = None
+        if last is not None and len(result) >= size:
+            next_cursor = encode_cursor(last.get_time(), last.values.get('device', ''), last.get_field())
+        return result, next_cursor
 
-        sql = f"""from(bucket: "{self.bucket}")
-         |> range({time_range})
-         |> filter(fn: (r) => r._measurement == "{measurement}" {cond})
-         |> group(columns: [])
-         |> sort(columns: ["_time"], desc: true)
-         |> limit(n: {size}, offset: {offset})"""
+    def aggregate(self, query_filter, window, fn, field="value"):
+        # aggregation runs in influxdb, only one row per window and area comes back
+        params = query_filter.params(default_range=AGGREGATE_RANGE)
+        params['field'] = field
+        return self.query_series(aggregate_query(self.bucket, query_filter.shape(), window, fn), params)
 
-        tables = self.client.query_api().query(sql, org=self.org)
+    def snapshot(self, query_filter, field="value"):
+        # newest row per (area, measurement) in one query
+        params = query_filter.params(default_range=SNAPSHOT_RANGE)
+        params['field'] = field
+        tables = self.client.query_api().query(snapshot_query(self.bucket, query_filter.shape()),
+                                               org=self.org, params=params)
         result = []
         for table in tables:
             for record in table.records:
-                area_name = ""
-                if 'area' in record.values:
-                    area_name = record['area']
-
-                line = {
-                    'measurement': record.get_measurement(),
-                    'area': area_name,
-                    record.get_field(): record.get_value(),
-                    'created_at': time_to_str(record.get_time()),
-                    'start_at': time_to_str(record.values['_start']),
-                    'end_at': time_to_str(record.values['_stop']),
-                }
-                for val in record.values:
-                    if val.startswith('_') is False and val != "result" and val != "table":
-                        line[val] = record.values[val]
-                result.append(line)
+                result.append(record_line(record))
         return result
 
-    def count(self, measurement):
-        if measurement != "":
-            sql = f"""from(bucket: "{self.bucket}")
-                     |> range(start: 0)
-                     |> filter(fn: (r) => r._measurement == "{measurement}")
-                     |> count() """
-        else:
-            sql = f"""from(bucket: "{self.bucket}")
-                     |> range(start: 0)
-                     |> count() """
+    def query_series(self, sql, params=None):
+        # one series per area: times in epoch milliseconds and values
+        tables = self.client.query_api().query(sql, org=self.org, params=params)
+        series = {}
+        for table in tables:
+            for record in table.records:
+                area_name = record.values.get('area', '')
+                if area_name not in series:
+                    series[area_name] = {
+                        'area': area_name,
+                        'time': [],
+                        'value': [],
+                    }
+                item = series[area_name]
+                item['time'].append((record.get_time() - EPOCH) // MILLISECOND)
+                item['value'].append(record.get_value())
+        return list(series.values())
 
-        tables = self.client.query_api().query(sql, org=self.org)
+    def count(self, measurement, start=None, stop=None):
+        # an empty measurement counts all of them, from the first record when start is None
+        params = QueryFilter(measurement, start=start or EPOCH, stop=stop).params()
+        sql = count_query(self.bucket, measurement != "")
+        tables = self.client.query_api().query(sql, org=self.org, params=params)
 
         counts = 0
         for table in tables:
@@ -77,6 +203,19 @@ class Connector:
 
         return counts
 
+    def count_by_day(self, start=None, stop=None):
+        # counts per measurement and utc day, from the first record when start is None
+        params = QueryFilter("", start=start or EPOCH, stop=stop).params()
+        tables = self.client.query_api().query(count_by_day_query(self.bucket), org=self.org, params=params)
+
+        result = {}
+        for table in tables:
+            for record in table.records:
+                key = (record.get_measurement(), record.get_time().astimezone(timezone.utc).date())
+                result[key] = result.get(key, 0) + record.get_value()
+
+        return result
+
     def measurement_list(self):
         sql = f"""
         import "influxdata/influxdb/schema"
@@ -90,3 +229,50 @@ class Connector:
                 result.append(record.get_value())
 
         return result
+
+
+def record_line(record):
+    area_name = ""
+    if 'area' in record.values:
+        area_name = record['area']
+
+    line = {
+        'measurement': record.get_measurement(),
+        'area': area_name,
+        record.get_field(): record.get_value(),
+        'created_at': time_to_str(record.get_time()),
+        'start_at': time_to_str(record.values['_start']),
+        'end_at': time_to_str(record.values['_stop']),
+    }
+    for val in record.values:
+        if val.startswith('_') is False and val != "result" and val != "table":
+            line[val] = record.values[val]
+    return line
+
+
+def line_key(line):
+    # measurement and time (epoch nanoseconds) of a line protocol record from insert_many
+    i = 0
+    while i < len(line) and line[i] not in ', ':
+        i += 2 if line[i] == '\\' else 1
+    return line[:i].replace('\\', ''), int(line.rsplit(' ', 1)[1])
+
+
+def flux_time(t):
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def encode_cursor(last_time, device, field):
+    # opaque to the client: last time in microseconds and the tie breaker of the last row
+    data = json.dumps([(last_time - EPOCH) // MICROSECOND, device, field], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        micros, device, field = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return EPOCH + timedelta(microseconds=int(micros)), str(device), str(field)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'invalid cursor: {cursor}') from e
@@ -0,0 +1,111 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from common.log import Logger
+
+
+class CountIndex:
+    """
+    Record count per measurement and day: one baseline scan, the increments seen on write,
+    and a periodic reconcile of the most recent days in the background. Running totals per
+    measurement answer a count without time range directly.
+    """
+    def __init__(self, connector, interval=3600, reconcile_days=2):
+        self.connector = connector
+        self.interval = interval
+        self.reconcile_days = reconcile_days
+        self.lock = threading.Lock()
+        self.daily = {}  # measurement -> {date: count}
+        self.totals = {}  # measurement -> count over all days
+        self.total = 0
+        self.after_mark = None  # increments seen while a scan is running
+        self.ready = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.logger = Logger(prefix='count index:')
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def increment(self, measurement, n, at=None):
+        day = (at or datetime.now(timezone.utc)).date()
+        with self.lock:
+            days = self.daily.setdefault(measurement, {})
+            days[day] = days.get(day, 0) + n
+            self.totals[measurement] = self.totals.get(measurement, 0) + n
+            self.total += n
+            if self.after_mark is not None:
+                self.after_mark[(measurement, day)] = self.after_mark.get((measurement, day), 0) + n
+
+    def count(self, measurement="", start=None, stop=None):
+        # None until the baseline scan is done; start/stop are compared by day
+        with self.lock:
+            if self.ready is False:
+                return None
+            if start is None and stop is None:
+                return self.totals.get(measurement, 0) if measurement != "" else self.total
+            if measurement != "":
+                measurements = [self.daily.get(measurement, {})]
+            else:
+                measurements = self.daily.values()
+
+            first = start.date() if start is not None else None
+            last = stop.date() if stop is not None else None
+            total = 0
+            for days in measurements:
+                for day, n in days.items():
+                    if first is not None and day < first:
+                        continue
+                    if last is not None and day > last:
+                        continue
+                    total += n
+            return total
+
+    def reconcile(self, full=False):
+        mark = datetime.now(timezone.utc)
+        start = None
+        if full is False:
+            day = mark.date() - timedelta(days=self.reconcile_days - 1)
+            start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        with self.lock:
+            self.after_mark = {}
+
+        try:
+            counts = self.connector.count_by_day(start, mark)
+        except Exception:
+            with self.lock:
+                self.after_mark = None
+            raise
+
+        with self.lock:
+            daily = {} if full else {m: dict(days) for m, days in self.daily.items()}
+            if full is False:  # scanned days are replaced
+                for days in daily.values():
+                    for day in [d for d in days if d >= start.date()]:
+                        del days[day]
+            for (measurement, day), n in counts.items():
+                daily.setdefault(measurement, {})[day] = n
+            for (measurement, day), n in self.after_mark.items():
+                days = daily.setdefault(measurement, {})
+                days[day] = days.get(day, 0) + n
+            self.daily = daily
+            self.totals = {measurement: sum(days.values()) for measurement, days in daily.items()}
+            self.total = sum(self.totals.values())
+            self.after_mark = None
+            self.ready = True
+
+    def _run(self):
+        full = True
+        while self.stop_event.is_set() is False:
+            try:
+                self.reconcile(full)
+                full = False
+            except Exception as e:
+                self.logger.error(f'reconcile failed: {e}')
+                self.stop_event.wait(60)
+                continue
+            self.stop_event.wait(self.interval)
@@ -1,14 +1,27 @@
 import os
+import re
 import json
 import constants.entity
 import constants.http
 import message_broker.channels as mb_channel
 import pytz
+from datetime import datetime
 from common.time import str_to_time, time_to_str, time_convert_timezone
 from common.base_service import BaseService
-from database.influxdb.connector import Connector
+from common.codec import decode_device
+from common.telemetry import get_samples
+from database.influxdb.cache import ResponseCache
+from database.influxdb.connector import Connector, line_key
+from database.influxdb.counter import CountIndex
+from database.influxdb.latest import LatestIndex
+from database.influxdb.query import QueryFilter
+from database.influxdb.tiers import TierManager
 from http import HTTPMethod
 
+AGGREGATE_FUNCTIONS = {'mean', 'min', 'max', 'count', 'last'}
+WINDOW_PATTERN = re.compile(r'^[1-9][0-9]*(ms|s|m|h|d|w|mo|y)$')
+FIELD_PATTERN = re.compile(r'^\w+$')
+
 
 class InfluxdbAdapter(BaseService):
     def __init__(self):
@@ -17,14 +30,19 @@ class InfluxdbAdapter(BaseService):
         self.port = constants.http.SERVICE_PORT_INFLUX
         config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'configuration.json')
         self.conf = json.load(open(config_path))
+        spool_dir = self.conf.get('spool_dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool'))
         self.data_db_connector = Connector(self.conf['url'],
                                            self.conf['token'],
                                            self.conf['org'],
-                                           "data")
+                                           "data",
+                                           batch_size=self.conf.get('batch_size', 500),
+                                           flush_interval=self.conf.get('flush_interval', 1.0),
+                                           spool_dir=os.path.join(spool_dir, 'data'))
         self.operation_db_connector = Connector(self.conf['url'],
                                                 self.conf['token'],
                                                 self.conf['org'],
-                                                "data")
+                                                self.conf.get('operation_bucket', "data"),
+                                                spool_dir=os.path.join(spool_dir, 'operation'))
         self.data_channel = mb_channel.STORAGE_DATA  # channel for store data
         self.operation_channel = mb_channel.STORAGE_OPERATION  # channel for store operation
         self.enable_measurement = {
@@ -36,15 +54,34 @@ class InfluxdbAdapter(BaseService):
             constants.entity.GAS: True,
             constants.entity.SOIL: True,
         }
+        self.latest = LatestIndex()  # newest sample seen on the data channel
+        # same data query within a few seconds is answered once
+        self.data_cache = ResponseCache(max_size=self.conf.get('cache_size', 256),
+                                        ttl=self.conf.get('cache_ttl', 5.0))
+        self.counter = CountIndex(self.data_db_connector)  # both connectors write to the same bucket
+        # hourly and daily rollups, raw retention only shortened when configured
+        self.tiers = TierManager(self.data_db_connector,
+                                 raw_retention=self.conf.get('raw_retention_days', 0) * 86400,
+                                 operation_bucket=self.operation_db_connector.bucket)
+        self.data_db_connector.add_written_listener(self.tiers.touch)  # late points are rolled up again
+        # cached responses are dropped once new points are stored, not when they are buffered
+        self.data_db_connector.add_written_listener(self.points_written)
 
     def start(self):
         super().start()
-        self.init_mqtt_client()
+        self.init_mqtt_client(workers=4)  # slow handlers must not block the network loop
         self.init_http_client(host=self.host, port=self.port)
+        self.counter.start()
+        self.tiers.start()
 
     def stop(self):
+        self.tiers.stop()
+        self.counter.stop()
         self.remove_mqtt_client()
         self.remove_http_client()
+        # write the buffered points before exit
+        self.data_db_connector.close()
+        self.operation_db_connector.close()
 
     def register_mqtt_service(self):
         # device data
@@ -56,26 +93,59 @@ class InfluxdbAdapter(BaseService):
         self.http_client.add_route(constants.http.INFLUX_MEASUREMENT_LIST, HTTPMethod.GET, self.http_measurement_list)
         # device data
         self.http_client.add_route(constants.http.INFLUX_DATA_GET, HTTPMethod.GET, self.http_data_get)
+        # newest data
+        self.http_client.add_route(constants.http.INFLUX_DATA_LATEST, HTTPMethod.GET, self.http_data_latest)
+        # newest stored data, one query for all areas and measurements
+        self.http_client.add_route(constants.http.INFLUX_DATA_SNAPSHOT, HTTPMethod.GET, self.http_data_snapshot)
+        # aggregated data
+        self.http_client.add_route(constants.http.INFLUX_DATA_AGGREGATE, HTTPMethod.GET, self.http_data_aggregate)
         # data count
         self.http_client.add_route(constants.http.INFLUX_DATA_COUNT, HTTPMethod.GET, self.http_data_count)
         # device operation
         self.http_client.add_route(constants.http.INFLUX_OPERATION_GET, HTTPMethod.GET, self.http_operation_get)
+        # write pipeline status
+        self.http_client.add_route(constants.http.INFLUX_STATUS, HTTPMethod.GET, self.http_status)
 
     def mqtt_data(self, client, userdata, msg):
         measurement = msg.topic.removeprefix(self.data_channel)
         if measurement not in self.enable_measurement:
             self.logger.warning(f'mqtt topic invalid: {msg.topic}')
             return
-        content = msg.payload.decode('utf-8')
-        data_dict = json.loads(content)
+        data_dict = decode_device(msg.payload)  # json or binary, told by the first byte
+        if data_dict is None:
+            self.logger.warning(f'topic {msg.topic} message device differs from its header, dropped')
+            return
         self.logger.info(f'record data: {data_dict}')
-        self.data_db_connector.insert(measurement, data_dict['tags'], data_dict['fields'])
+        # single sample or a batch envelope, a batch is one multi-point write
+        samples = get_samples(data_dict)
+        self.data_db_connector.insert_many(measurement, data_dict['tags'], samples)
+        now = datetime.now(pytz.utc)
+        for fields, at in samples:
+            at = datetime.fromtimestamp(at / 1e9, pytz.utc) if at is not None else now
+            self.latest.update(measurement, data_dict['tags'], fields, at)
+            self.counter.increment(measurement, written_fields(fields), at)
+
+    def points_written(self, lines):
+        for measurement in {line_key(line)[0] for line in lines}:
+            self.data_cache.invalidate(measurement)
 
     def mqtt_operation(self, client, userdata, msg):
-        content = msg.payload.decode('utf-8')
-        data_dict = json.loads(content)
+        data_dict = decode_device(msg.payload)
+        if data_dict is None:
+            self.logger.warning(f'topic {msg.topic} message device differs from its header, dropped')
+            return
         self.logger.info(f'record operation: {data_dict}')
         self.operation_db_connector.insert("default", data_dict['tags'], data_dict['fields'])
+        self.counter.increment("default", written_fields(data_dict['fields']))
+
+    def http_status(self, params):
+        return {
+            'mqtt': self.mqtt_stats(),
+            'data': self.data_db_connector.write_stats(),
+            'operation': self.operation_db_connector.write_stats(),
+            'tiers': self.tiers.stats(),
+            'cache': self.data_cache.stats(),
+        }
 
     def http_measurement_list(self, param):
         result = self.data_db_connector.measurement_list()
@@ -89,114 +159,180 @@ class InfluxdbAdapter(BaseService):
         if 'measurement' in params:
             measurement = params['measurement']
 
-        counts = self.data_db_connector.count(measurement)
+        start_time = None
+        stop_time = None
+        if 'start_at' in params:
+            start_time = str_to_time(params['start_at'])
+        if 'stop_at' in params:
+            stop_time = str_to_time(params['stop_at'])
+
+        counts = self.counter.count(measurement, start_time, stop_time)
+        if counts is None:  # baseline scan not finished yet
+            counts = self.data_db_connector.count(measurement, start_time, stop_time)
 
         return {
             'count': counts
         }
 
-    def http_data_get(self, params):
-        if 'measurement' not in params:
+    def http_data_latest(self, params):
+        measurement_list = param_list(params, 'measurement_list')
+        area_list = param_list(params, 'area_list')
+        if len(measurement_list) == 0 or len(area_list) == 0:
             return {
                 'list': []
             }
 
-        if 'area_list' not in params or len(params['area_list']) == 0:
-            return {
-                'list': []
+        result = []
+        for area, measurement, device, at, fields in self.latest.get(measurement_list, area_list,
+                                                                     params.get('name')):
+            line = {
+                'measurement': measurement,
+                'area': area,
+                'device': device,
+                'created_at': time_to_str(at.astimezone(pytz.timezone('Europe/Rome'))),
             }
+            line.update(fields)
+            result.append(line)
+
+        # pairs not seen since start (cold index) are read from the database
+        seen = {(line['area'], line['measurement']) for line in result}
+        missing = [(a, m) for a in area_list for m in measurement_list if (a, m) not in seen]
+        if len(missing) > 0:
+            query_filter = QueryFilter({m for _, m in missing}, {a for a, _ in missing}, params.get('name'))
+            for line in to_local_time(self.data_db_connector.snapshot(query_filter), 'Europe/Rome'):
+                if (line['area'], line['measurement']) in missing:
+                    result.append(line)
 
-        if isinstance(params['area_list'], str):
-            area = params['area_list']
-            params['area_list'] = [area]
-
-        measurement = params['measurement']
-        time_cond = []
-        filter_cond = ""
-
-        if 'name' in params:
-            filter_cond += f' and r.device == "{params["name"]}"'
-
-        area_list = []
-        for area in params['area_list']:
-            area_list.append(f'r.area == "{area}"')
-        filter_cond += f' and ({" or ".join(area_list)})'
-
-        if 'start_at' in params:
-            start_time = str_to_time(params["start_at"])
-            time_cond.append(f'start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")}')
+        return {
+            'list': result
+        }
 
-        if 'stop_at' in params:
-            stop_time = str_to_time(params["stop_at"])
-            time_cond.append(f'stop: {stop_time.strftime("%Y-%m-%dT%H:%M:%SZ")}')
+    def http_data_snapshot(self, params):
+        measurement_list = param_list(params, 'measurement_list')
+        area_list = param_list(params, 'area_list')
+        if len(measurement_list) == 0 or len(area_list) == 0:
+            return {
+                'list': []
+            }
 
-        if 'page' not in params:
-            params['page'] = 1
-        else:
-            params['page'] = int(params['page'])
+        query_filter = QueryFilter.from_params(measurement_list, params)
+        result = self.data_db_connector.snapshot(query_filter, params.get('field', 'value'))
 
-        if 'size' not in params:
-            params['size'] = 10
-        else:
-            params['size'] = int(params['size'])
+        return {
+            'list': to_local_time(result, 'Europe/Rome')
+        }
 
-        time_range = None
-        if len(time_cond) > 0:
-            time_range = ", ".join(time_cond)
+    def http_data_aggregate(self, params):
+        area_list = param_list(params, 'area_list')
+        if 'measurement' not in params or len(area_list) == 0:
+            return {
+                'list': []
+            }
 
-        result = self.data_db_connector.query(measurement, time_range=time_range, cond=filter_cond,
-                                              page=params['page'], size=params['size'])
+        window = params.get('window', '1h')
+        fn = params.get('fn', 'mean')
+        field = params.get('field', 'value')
+        if WINDOW_PATTERN.match(window) is None or fn not in AGGREGATE_FUNCTIONS or FIELD_PATTERN.match(field) is None:
+            return {
+                'code': 400,
+                'message': f'invalid window: {window}, fn: {fn} or field: {field}',
+                'list': []
+            }
 
-        for i in range(len(result)):
-            created_at = str_to_time(result[i]['created_at'])
-            result[i]['created_at'] = time_to_str(time_convert_timezone(created_at, pytz.utc, 'Europe/Rome'))
+        # columnar result: per area, time in epoch milliseconds and values in two arrays,
+        # read from the coarsest rollup tier that fits the window
+        query_filter = QueryFilter.from_params(params['measurement'], params)
+        result = self.tiers.aggregate(query_filter, window, fn, field)
 
         return {
+            'window': window,
+            'fn': fn,
             'list': result
         }
 
-    def http_operation_get(self, params):
-        if 'area_list' not in params or len(params['area_list']) == 0:
+    def http_data_get(self, params):
+        if 'measurement' not in params:
             return {
                 'list': []
             }
 
-        time_cond = []
-        filter_cond = ""
-
-        if 'name' in params:
-            filter_cond += f' and r.device == "{params["name"]}"'
+        measurement = params['measurement']
+        return self.data_cache.get(measurement, cache_key(params),
+                                   lambda: self.query_page(self.data_db_connector, measurement, params,
+                                                           tz='Europe/Rome'))
 
-        area_list = []
-        for area in params['area_list']:
-            area_list.append(f'r.area == "{area}"')
-        filter_cond += f' and ({" or ".join(area_list)})'
+    def http_operation_get(self, params):
+        return self.query_page(self.operation_db_connector, "default", params)
 
-        if 'start_at' in params:
-            start_time = str_to_time(params["start_at"])
-            time_cond.append(f'start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")}')
+    @staticmethod
+    def query_page(connector, measurement, params, tz=None):
+        # shared by data and operation queries, created_at is converted to tz when given
+        if len(param_list(params, 'area_list')) == 0:
+            return {
+                'list': []
+            }
 
-        if 'stop_at' in params:
-            stop_time = str_to_time(params["stop_at"])
-            time_cond.append(f'stop: {stop_time.strftime("%Y-%m-%dT%H:%M:%SZ")}')
+        query_filter = QueryFilter.from_params(measurement, params)
+        page = int(params.get('page', 1))
+        size = int(params.get('size', 10))
 
-        if 'page' not in params:
-            params['page'] = 1
-        else:
-            params['page'] = int(params['page'])
+        if params.get('format') == 'columnar':
+            columns = connector.query_columns(query_filter, page=page, size=size, tz=tz)
+            return {
+                'columns': columns
+            }
 
-        if 'size' not in params:
-            params['size'] = 10
+        next_cursor = None
+        if 'cursor' in params:
+            # cursor mode, an empty cursor asks for the first page
+            cursor = params['cursor'] if params['cursor'] != "" else None
+            try:
+                result, next_cursor = connector.query_after(query_filter, cursor=cursor, size=size)
+            except ValueError as e:
+                return {
+                    'code': 400,
+                    'message': str(e),
+                    'list': []
+                }
         else:
-            params['size'] = int(params['size'])
+            result = connector.query(query_filter, page=page, size=size)
 
-        time_range = None
-        if len(time_cond) > 0:
-            time_range = ", ".join(time_cond)
-
-        result = self.operation_db_connector.query("default", time_range=time_range, cond=filter_cond,
-                                                   page=params['page'], size=params['size'])
+        if tz is not None:
+            result = to_local_time(result, tz)
 
+        if 'cursor' in params:
+            return {
+                'list': result,
+                'next_cursor': next_cursor
+            }
         return {
             'list': result
         }
+
+
+def to_local_time(result, tz):
+    for line in result:
+        created_at = str_to_time(line['created_at'])
+        line['created_at'] = time_to_str(time_convert_timezone(created_at, pytz.utc, tz))
+    return result
+
+
+def cache_key(params):
+    # area order and repeats do not change the result
+    return (params['measurement'], tuple(sorted(set(param_list(params, 'area_list')))), params.get('name'),
+            params.get('start_at'), params.get('stop_at'), str(params.get('page', 1)), str(params.get('size', 10)),
+            params.get('cursor'), params.get('format'))
+
+
+def param_list(params, key):
+    # query string gives a str for a single value and a list for repeated values
+    if key not in params:
+        return []
+    if isinstance(params[key], str):
+        return [params[key]]
+    return list(params[key])
+
+
+def written_fields(fields):
+    # None fields are left out of the line protocol, they are not counted
+    return sum(1 for value in fields.values() if value is not None)
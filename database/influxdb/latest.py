@@ -0,0 +1,38 @@
+import threading
+
+
+class LatestIndex:
+    """
+    Newest sample per (area, measurement, device), kept up to date from the stored data.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = {}  # (area, measurement) -> {device: (time, fields)}
+
+    def update(self, measurement, tags, fields, at):
+        # sensors send None on a read error, it must not replace the last good value
+        fields = {k: v for k, v in fields.items() if v is not None}
+        if len(fields) == 0:
+            return
+        key = (tags.get('area', ''), measurement)
+        device = tags.get('device', '')
+        with self.lock:
+            devices = self.index.setdefault(key, {})
+            last = devices.get(device)
+            if last is not None and last[0] > at:  # late sample
+                return
+            devices[device] = (at, fields)
+
+    def get(self, measurement_list, area_list, device=None):
+        result = []
+        with self.lock:
+            for area in area_list:
+                for measurement in measurement_list:
+                    devices = self.index.get((area, measurement))
+                    if devices is None:
+                        continue
+                    for name, (at, fields) in devices.items():
+                        if device is not None and name != device:
+                            continue
+                        result.append((area, measurement, name, at, fields))
+        return result
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from common.time import str_to_time
+
+DEFAULT_RANGE = timedelta(minutes=120)
+AGGREGATE_RANGE = timedelta(hours=24)
+SNAPSHOT_RANGE = timedelta(days=7)
+
+
+class QueryFilter:
+    """
+    Filter of a data or operation query, sent to influxdb as flux params instead of being written into the query.
+    The query text only depends on which filters are set, so it stays the same between requests and is built once.
+    """
+    def __init__(self, measurement, area_list=None, device=None, start=None, stop=None):
+        # one measurement, or a list of them
+        self.measurement = measurement if isinstance(measurement, str) else normalize_list(measurement)
+        self.area_list = normalize_list(area_list) if area_list is not None else None
+        self.device = device
+        self.start = utc(start) if start is not None else None
+        self.stop = utc(stop) if stop is not None else None
+
+    @staticmethod
+    def from_params(measurement, params):
+        # request params: area_list (str or list), name, start_at, stop_at
+        area_list = params.get('area_list')
+        if isinstance(area_list, str):
+            area_list = [area_list]
+        start = str_to_time(params['start_at']) if 'start_at' in params else None
+        stop = str_to_time(params['stop_at']) if 'stop_at' in params else None
+        return QueryFilter(measurement, area_list, params.get('name'), start, stop)
+
+    def shape(self):
+        return isinstance(self.measurement, list), self.area_list is not None, self.device is not None
+
+    def params(self, default_range=DEFAULT_RANGE):
+        stop = self.stop if self.stop is not None else datetime.now(timezone.utc)
+        start = self.start if self.start is not None else stop - default_range
+        result = {
+            'start': start,
+            'stop': stop,
+        }
+        if isinstance(self.measurement, list):
+            result['measurements'] = self.measurement
+        else:
+            result['measurement'] = self.measurement
+        if self.area_list is not None:
+            result['areas'] = self.area_list
+        if self.device is not None:
+            result['device'] = self.device
+        return result
+
+
+def normalize_list(values):
+    # same set in any order or with repeats gives the same param value
+    return sorted(set(values))
+
+
+def utc(t):
+    if t.tzinfo is None:
+        return t.replace(tzinfo=timezone.utc)
+    return t
+
+
+@lru_cache(maxsize=32)
+def filter_expr(has_measurements, has_areas, has_device):
+    expr = 'r._measurement == params.measurement'
+    if has_measurements:
+        expr = 'contains(value: r._measurement, set: params.measurements)'
+    if has_areas:
+        expr += ' and contains(value: r.area, set: params.areas)'
+    if has_device:
+        expr += ' and r.device == params.device'
+    return expr
+
+
+@lru_cache(maxsize=32)
+def page_query(bucket, shape):
+    return f"""from(bucket: "{bucket}")
+     |> range(start: params.start, stop: params.stop)
+     |> filter(fn: (r) => {filter_expr(*shape)})
+     |> group(columns: [])
+     |> sort(columns: ["_time"], desc: true)
+     |> limit(n: params.size, offset: params.offset)"""
+
+
+@lru_cache(maxsize=32)
+def after_query(bucket, shape, has_cursor):
+    # rows at the cursor time are picked by the (device, field) tie breaker
+    cursor_cond = ""
+    if has_cursor:
+        cursor_cond = ('|> filter(fn: (r) => r._time < params.cursor_time or (r._time == params.cursor_time and '
+                       '(r.device < params.cursor_device or '
+                       '(r.device == params.cursor_device and r._field < params.cursor_field))))')
+
+    # series are stored in time order, take the newest rows of each series before the global sort
+    return f"""from(bucket: "{bucket}")
+     |> range(start: params.start, stop: params.stop)
+     |> filter(fn: (r) => {filter_expr(*shape)})
+     {cursor_cond}
+     |> tail(n: params.size)
+     |> group(columns: [])
+     |> sort(columns: ["_time", "device", "_field"], desc: true)
+     |> limit(n: params.size)"""
+
+
+@lru_cache(maxsize=128)
+def aggregate_query(bucket, shape, window, fn):
+    # window and fn are checked against a whitelist by the caller, flux takes no function as param
+    return f"""from(bucket: "{bucket}")
+     |> range(start: params.start, stop: params.stop)
+     |> filter(fn: (r) => {filter_expr(*shape)} and r._field == params.field)
+     |> group(columns: ["area"])
+     |> aggregateWindow(every: {window}, fn: {fn}, createEmpty: false)"""
+
+
+@lru_cache(maxsize=32)
+def snapshot_query(bucket, shape):
+    # newest value of every area and measurement, one table per pair: last() of each series, which is
+    # stored in time order, then the newest of those, a grouped table is not sorted by time
+    return f"""from(bucket: "{bucket}")
+     |> range(start: params.start, stop: params.stop)
+     |> filter(fn: (r) => {filter_expr(*shape)} and r._field == params.field)
+     |> last()
+     |> group(columns: ["area", "_measurement"])
+     |> max(column: "_time")"""
+
+
+@lru_cache(maxsize=32)
+def count_query(bucket, has_measurement):
+    # records of one measurement, or of all of them
+    measurement_cond = '|> filter(fn: (r) => r._measurement == params.measurement)' if has_measurement else ''
+    return f"""from(bucket: "{bucket}")
+     |> range(start: params.start, stop: params.stop)
+     {measurement_cond}
+     |> count()"""
+
+
+@lru_cache(maxsize=32)
+def count_by_day_query(bucket):
+    # counts per measurement and utc day, windows start at midnight
+    return f"""from(bucket: "{bucket}")
+     |> range(start: params.start, stop: params.stop)
+     |> group(columns: ["_measurement"])
+     |> aggregateWindow(every: 1d, fn: count, timeSrc: "_start", createEmpty: false)"""
@@ -0,0 +1,271 @@
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from common.log import Logger
+from database.influxdb.writer import is_rejected
+
+# segment file: [committed read offset][record]...[zero header]
+# record: [length, crc32, spooled time (ns)][payload: line protocol joined by '\n']
+OFFSET = struct.Struct('<Q')
+HEADER = struct.Struct('<IIQ')
+DATA_START = OFFSET.size
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+
+
+class Segment:
+    def __init__(self, path, seq, size=0):
+        self.path = path
+        self.seq = seq
+        exists = os.path.exists(path)
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if os.path.getsize(path) < max(size, DATA_START + HEADER.size):
+            self.file.truncate(max(size, DATA_START + HEADER.size))
+        self.size = os.path.getsize(path)
+        self.mm = mmap.mmap(self.file.fileno(), self.size)
+        self.read_offset = DATA_START
+        self.write_offset = DATA_START
+        self.records = 0  # records not replayed yet
+        if exists:
+            self._recover()
+
+    def _recover(self):
+        committed = OFFSET.unpack_from(self.mm, 0)[0]
+        offset = DATA_START
+        while True:
+            record = self.read(offset)
+            if record is None:
+                break
+            if offset >= committed:
+                self.records += 1
+            offset = record[2]
+        self.write_offset = offset
+        self.read_offset = min(max(committed, DATA_START), offset)
+
+    def append(self, payload, spooled_at):
+        end = self.write_offset + HEADER.size + len(payload)
+        if end + HEADER.size > self.size:
+            return False
+        # end marker first, so a torn write is never followed by a stale record
+        HEADER.pack_into(self.mm, end, 0, 0, 0)
+        self.mm[self.write_offset + HEADER.size:end] = payload
+        HEADER.pack_into(self.mm, self.write_offset, len(payload), zlib.crc32(payload), spooled_at)
+        self.write_offset = end
+        self.records += 1
+        return True
+
+    def read(self, offset):
+        if offset + HEADER.size > self.size:
+            return None
+        length, crc, spooled_at = HEADER.unpack_from(self.mm, offset)
+        end = offset + HEADER.size + length
+        if length == 0 or end > self.size:
+            return None
+        payload = self.mm[offset + HEADER.size:end]
+        if zlib.crc32(payload) != crc:
+            return None
+        return payload, spooled_at, end
+
+    def commit(self, offset, records):
+        self.read_offset = offset
+        self.records -= records
+        OFFSET.pack_into(self.mm, 0, offset)
+
+    def pending(self):
+        return self.read_offset < self.write_offset
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+
+
+class Spool:
+    """
+    Append only, segment based log on disk for points that failed to be written,
+    replayed in bulk with a rate limit once the database is reachable again.
+    """
+    def __init__(self, name, directory, segment_size=16 * 1024 * 1024, max_size=512 * 1024 * 1024,
+                 replay_rate=5000, replay_batch=5000):
+        self.name = name
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.replay_rate = replay_rate  # points per second
+        self.replay_batch = replay_batch  # points per write
+        self.lock = threading.Lock()
+        self.segments = []
+        self.running = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.write_func = None
+        self.logger = Logger(prefix=f'spool {name}:')
+        # counters
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        for filename in sorted(os.listdir(self.directory)):
+            if not (filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX)):
+                continue
+            seq = int(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            self.segments.append(Segment(os.path.join(self.directory, filename), seq))
+        self.segments.sort(key=lambda s: s.seq)
+        records = sum(s.records for s in self.segments)
+        if records > 0:
+            self.logger.info(f'found {records} spooled records in {len(self.segments)} segments')
+
+    def _new_segment(self, size):
+        # replayed segments are not needed once a new one takes over the appending
+        for segment in [s for s in self.segments if s.pending() is False]:
+            self.segments.remove(segment)
+            segment.delete()
+        seq = self.segments[-1].seq + 1 if len(self.segments) > 0 else 0
+        path = os.path.join(self.directory, f'{SEGMENT_PREFIX}{seq:012d}{SEGMENT_SUFFIX}')
+        segment = Segment(path, seq, size)
+        self.segments.append(segment)
+        return segment
+
+    def _size(self):
+        return sum(s.size for s in self.segments)
+
+    def append(self, lines):
+        payload = '\n'.join(lines).encode('utf-8')
+        with self.lock:
+            if len(self.segments) > 0 and self.segments[-1].append(payload, time.time_ns()):
+                self.spooled += len(lines)
+                return True
+            size = max(self.segment_size, DATA_START + 2 * HEADER.size + len(payload))
+            if size > self.max_size:
+                # never fits, the spooled segments are kept
+                self.dropped += len(lines)
+                return False
+            # size cap, drop the oldest segments first
+            while len(self.segments) > 0 and self._size() + size > self.max_size:
+                oldest = self.segments.pop(0)
+                self.dropped += oldest.records
+                self.logger.warning(f'spool full, drop segment {oldest.seq} with {oldest.records} records')
+                oldest.delete()
+            self._new_segment(size).append(payload, time.time_ns())
+            self.spooled += len(lines)
+            return True
+
+    def read_batch(self, max_lines):
+        # returns lines and the position to commit once they are written
+        with self.lock:
+            lines = []
+            position = []
+            for segment in self.segments:
+                offset = segment.read_offset
+                records = 0
+                while len(lines) < max_lines:
+                    record = segment.read(offset)
+                    if record is None or offset >= segment.write_offset:
+                        break
+                    lines.extend(record[0].decode('utf-8').split('\n'))
+                    offset = record[2]
+                    records += 1
+                if records > 0:
+                    position.append((segment, offset, records))
+                if len(lines) >= max_lines or offset < segment.write_offset:
+                    break
+            return lines, position
+
+    def commit(self, position):
+        with self.lock:
+            for segment, offset, records in position:
+                if segment not in self.segments:  # dropped by the size cap
+                    continue
+                segment.commit(offset, records)
+                # active segment stays open for appending
+                if segment.pending() is False and segment is not self.segments[-1]:
+                    self.segments.remove(segment)
+                    segment.delete()
+
+    def empty(self):
+        with self.lock:
+            return all(s.pending() is False for s in self.segments)
+
+    def lag(self):
+        # age of the oldest record not replayed yet
+        with self.lock:
+            for segment in self.segments:
+                if segment.pending():
+                    record = segment.read(segment.read_offset)
+                    if record is not None:
+                        return max(0.0, (time.time_ns() - record[1]) / 1e9)
+            return 0.0
+
+    def stats(self):
+        lag = self.lag()
+        with self.lock:
+            return {
+                'segments': len(self.segments),
+                'size_bytes': self._size(),
+                'pending_bytes': sum(s.write_offset - s.read_offset for s in self.segments),
+                'pending_records': sum(s.records for s in self.segments),
+                'replay_lag_sec': round(lag, 3),
+                'spooled': self.spooled,
+                'replayed': self.replayed,
+                'dropped': self.dropped,
+            }
+
+    def start(self, write_func):
+        if self.running:
+            return
+        self.write_func = write_func
+        self.running = True
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._replay, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+
+    def _replay(self):
+        backoff = 1.0
+        while self.running:
+            lines, position = self.read_batch(self.replay_batch)
+            if len(lines) == 0:
+                self.stop_event.wait(1)
+                continue
+            begin = time.monotonic()
+            try:
+                self.write_func(lines)
+            except Exception as e:
+                if is_rejected(e):
+                    self.logger.error(f'replay rejected, drop {len(lines)} points: {e}')
+                    self.commit(position)
+                    self.dropped += len(lines)
+                    continue
+                self.logger.warning(f'replay failed, retry in {backoff:.1f}s: {e}')
+                self.stop_event.wait(backoff * random.uniform(0.5, 1.5))
+                backoff = min(backoff * 2, 60.0)
+                continue
+            backoff = 1.0
+            self.commit(position)
+            self.replayed += len(lines)
+            self.logger.info(f'replayed {len(lines)} points, lag: {self.lag():.1f}s')
+            # rate limit, do not flood the database right after recovery
+            wait = len(lines) / self.replay_rate - (time.monotonic() - begin)
+            if wait > 0:
+                self.stop_event.wait(wait)
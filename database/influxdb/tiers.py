@@ -0,0 +1,322 @@
+import operator
+import re
+import threading
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+from common.log import Logger
+from database.influxdb.connector import EPOCH, flux_time, line_key
+from database.influxdb.query import AGGREGATE_RANGE, filter_expr
+from influxdb_client import BucketRetentionRules
+
+WINDOW_UNITS = {
+    'ms': 0.001,
+    's': 1,
+    'm': 60,
+    'h': 3600,
+    'd': 86400,
+    'w': 7 * 86400,
+}
+# aggregates stored per rollup window and how they are aggregated again, mean is read as sum / count
+MERGE_FUNCTIONS = {
+    'sum': 'sum',
+    'count': 'sum',
+    'min': 'min',
+    'max': 'max',
+    'last': 'last',
+}
+# rolled up aggregates an aggregation is computed from
+PARTS = {
+    'mean': ('sum', 'count'),
+    'min': ('min',),
+    'max': ('max',),
+    'count': ('count',),
+    'last': ('last',),
+}
+# partial values of one window in time order, before and after the watermark
+COMBINE = {
+    'sum': operator.add,
+    'count': operator.add,
+    'min': min,
+    'max': max,
+    'last': lambda a, b: b,
+}
+SKIP_MEASUREMENTS = ['default']  # operation records are not numeric
+
+
+class Tier:
+    def __init__(self, name, bucket, every, retention, source=None, chunk=1):
+        self.name = name
+        self.bucket = bucket
+        self.every = every  # seconds per window
+        self.retention = retention  # seconds, 0 keeps data forever
+        self.source = source  # tier rolled up from, None for the raw bucket
+        self.chunk = chunk  # windows written per rollup query
+        self.watermark = None  # windows before this time are rolled up
+
+
+class TierManager:
+    """
+    Raw bucket plus hourly and daily rollup buckets filled by a background downsampler,
+    aggregations read from the coarsest tier that still has the requested resolution.
+    """
+    def __init__(self, connector, raw_retention=0, interval=300, grace=300, operation_bucket=None):
+        self.connector = connector
+        self.raw_retention = raw_retention
+        self.interval = interval
+        self.grace = grace  # seconds a window stays open for late points before it is rolled up
+        self.hour = Tier('hour', connector.bucket + '_1h', 3600, 365 * 86400, chunk=24 * 7)
+        self.day = Tier('day', connector.bucket + '_1d', 86400, 0, source=self.hour, chunk=90)
+        self.tiers = [self.hour, self.day]
+        self.retention_applied = False
+        self.late_lock = threading.Lock()
+        self.late = None  # oldest point written after the grace period, its windows are rolled up again
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.logger = Logger(prefix='tier manager:')
+        if raw_retention > 0 and operation_bucket == connector.bucket:
+            # operation records are never rolled up, a shorter retention would drop them
+            self.logger.warning(f'raw retention not applied, operation records share bucket {connector.bucket}')
+            self.raw_retention = 0
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while self.stop_event.is_set() is False:
+            try:
+                self.ensure_buckets()
+                self.rewind()
+                for tier in self.tiers:
+                    self.downsample(tier)
+                self.apply_retention()
+            except Exception as e:
+                self.logger.error(f'downsample failed: {e}')
+            self.stop_event.wait(self.interval)
+
+    def ensure_buckets(self):
+        api = self.connector.client.buckets_api()
+        for tier in self.tiers:
+            if api.find_bucket_by_name(tier.bucket) is not None:
+                continue
+            rules = []
+            if tier.retention > 0:
+                rules.append(BucketRetentionRules(type='expire', every_seconds=tier.retention))
+            api.create_bucket(bucket_name=tier.bucket, retention_rules=rules, org=self.connector.org)
+            self.logger.info(f'create bucket {tier.bucket}')
+
+    def apply_retention(self):
+        # shorten the raw retention only once the hourly tier covers what would expire
+        if self.raw_retention <= 0 or self.retention_applied or self.hour.watermark is None:
+            return
+        if self.hour.watermark < datetime.now(timezone.utc) - timedelta(seconds=self.raw_retention):
+            return
+        api = self.connector.client.buckets_api()
+        bucket = api.find_bucket_by_name(self.connector.bucket)
+        if bucket is None:
+            return
+        bucket.retention_rules = [BucketRetentionRules(type='expire', every_seconds=self.raw_retention)]
+        api.update_bucket(bucket)
+        self.retention_applied = True
+        self.logger.info(f'raw bucket retention set to {self.raw_retention}s')
+
+    def touch(self, lines):
+        # written listener of the raw connector: remember points older than the grace period
+        mark = (datetime.now(timezone.utc) - timedelta(seconds=self.grace) - EPOCH) // timedelta(microseconds=1) * 1000
+        oldest = None
+        for line in lines:
+            measurement, at = line_key(line)
+            if measurement in SKIP_MEASUREMENTS or at >= mark:
+                continue
+            oldest = at if oldest is None else min(oldest, at)
+        if oldest is None:
+            return
+        with self.late_lock:
+            self.late = oldest if self.late is None else min(self.late, oldest)
+
+    def rewind(self):
+        # late or replayed points: roll their windows up again, rollup points are overwritten in place
+        with self.late_lock:
+            late, self.late = self.late, None
+        if late is None:
+            return
+        at = EPOCH + timedelta(microseconds=late // 1000)
+        for tier in self.tiers:
+            start = floor_time(at, tier.every)
+            if tier.watermark is not None and start < tier.watermark:
+                tier.watermark = start
+                self.logger.info(f'{tier.name} tier rewound to {flux_time(start)} for late points')
+
+    def downsample(self, tier):
+        if tier.watermark is None:
+            tier.watermark = self._init_watermark(tier)
+        target = floor_time(datetime.now(timezone.utc) - timedelta(seconds=self.grace), tier.every)
+        if tier.source is not None:
+            if tier.source.watermark is None:
+                return
+            target = min(target, floor_time(tier.source.watermark, tier.every))
+
+        while tier.watermark < target and self.stop_event.is_set() is False:
+            stop = min(target, tier.watermark + timedelta(seconds=tier.every * tier.chunk))
+            for fn in MERGE_FUNCTIONS:
+                self.connector.client.query_api().query(self._rollup_sql(tier, fn, tier.watermark, stop),
+                                                        org=self.connector.org)
+            tier.watermark = stop
+            self.logger.info(f'{tier.name} tier rolled up to {flux_time(stop)}')
+
+    def _rollup_sql(self, tier, fn, start, stop):
+        # rolled up points are stamped with the start of their window, so they fall into the same window again;
+        # all aggregates share the value field, count is cast to float like the others
+        if tier.source is None:
+            skip = " and ".join([f'r._measurement != "{m}"' for m in SKIP_MEASUREMENTS])
+            return f"""import "types"
+            from(bucket: "{self.connector.bucket}")
+             |> range(start: {flux_time(start)}, stop: {flux_time(stop)})
+             |> filter(fn: (r) => {skip} and types.isNumeric(v: r._value))
+             |> aggregateWindow(every: {tier.every}s, fn: {fn}, timeSrc: "_start", createEmpty: false)
+             |> set(key: "agg", value: "{fn}")
+             |> toFloat()
+             |> to(bucket: "{tier.bucket}", org: "{self.connector.org}")"""
+
+        return f"""from(bucket: "{tier.source.bucket}")
+         |> range(start: {flux_time(start)}, stop: {flux_time(stop)})
+         |> filter(fn: (r) => r.agg == "{fn}")
+         |> aggregateWindow(every: {tier.every}s, fn: {MERGE_FUNCTIONS[fn]}, timeSrc: "_start", createEmpty: false)
+         |> set(key: "agg", value: "{fn}")
+         |> toFloat()
+         |> to(bucket: "{tier.bucket}", org: "{self.connector.org}")"""
+
+    def _init_watermark(self, tier):
+        # continue after the last rolled up window, or start from the oldest source data;
+        # windows rolled up before sums were stored are rolled up again
+        last = self._edge_time(tier.bucket, 'last', '|> filter(fn: (r) => r.agg == "sum")')
+        if last is not None:
+            return last + timedelta(seconds=tier.every)
+        source = tier.source.bucket if tier.source is not None else self.connector.bucket
+        first = self._edge_time(source, 'first')
+        if first is None:
+            return floor_time(datetime.now(timezone.utc), tier.every)
+        return floor_time(first, tier.every)
+
+    def _edge_time(self, bucket, fn, where=""):
+        sql = f"""from(bucket: "{bucket}")
+         |> range(start: 0)
+         {where}
+         |> {fn}()
+         |> keep(columns: ["_time"])"""
+        tables = self.connector.client.query_api().query(sql, org=self.connector.org)
+        times = [record.get_time() for table in tables for record in table.records]
+        if len(times) == 0:
+            return None
+        return max(times) if fn == 'last' else min(times)
+
+    def select(self, start, window):
+        # coarsest tier whose resolution divides the window and that has data after start
+        seconds = window_seconds(window)
+        if seconds is None:
+            return None
+        for tier in reversed(self.tiers):
+            if tier.watermark is None or tier.watermark <= start:
+                continue
+            if seconds >= tier.every and seconds % tier.every == 0:
+                return tier
+        return None
+
+    def aggregate(self, query_filter, window, fn, field="value"):
+        params = query_filter.params(default_range=AGGREGATE_RANGE)
+        tier = self.select(params['start'], window)
+        if tier is None:
+            return self.connector.aggregate(query_filter, window, fn, field)
+
+        # rolled up windows from the tier, the part after its watermark from the raw bucket,
+        # partial windows on both sides of the watermark are merged here
+        params['field'] = field
+        params['watermark'] = min(tier.watermark, params['stop'])
+        sql = rollup_query(tier.bucket, self.connector.bucket, query_filter.shape(), window, fn,
+                           params['watermark'] < params['stop'])
+        tables = self.connector.client.query_api().query(sql, org=self.connector.org, params=params)
+        parts = [(record.values.get('area', ''), record.values['agg'], record.get_time(), record.get_value())
+                 for table in tables for record in table.records]
+        return merge_windows(parts, fn, window_seconds(window), params['stop'])
+
+    def stats(self):
+        return {
+            tier.name: {
+                'bucket': tier.bucket,
+                'watermark': flux_time(tier.watermark) if tier.watermark is not None else None,
+            } for tier in self.tiers
+        }
+
+
+def window_seconds(window):
+    # fixed length windows only, months and years follow the calendar
+    match = re.match(r'^([1-9][0-9]*)(ms|s|m|h|d|w)$', window)
+    if match is None:
+        return None
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+
+def floor_time(t, seconds):
+    return EPOCH + timedelta(seconds=(t - EPOCH) // timedelta(seconds=seconds) * seconds)
+
+
+def merge_windows(parts, fn, seconds, stop):
+    # parts: (area, agg, time, value) stamped with their window start, or the range start or watermark
+    # inside it; returns one series per area stamped with the window stop like connector.aggregate
+    windows = {}
+    for area, agg, at, value in sorted(parts, key=lambda part: part[2]):
+        values = windows.setdefault((area, floor_time(at, seconds)), {})
+        values[agg] = COMBINE[agg](values[agg], value) if agg in values else value
+
+    series = {}
+    for (area, start), values in sorted(windows.items(), key=lambda item: item[0][1]):
+        if any(agg not in values for agg in PARTS[fn]):
+            continue
+        if fn == 'mean':
+            if values['count'] == 0:
+                continue
+            value = values['sum'] / values['count']
+        else:
+            value = values[fn]
+        item = series.setdefault(area, {'area': area, 'time': [], 'value': []})
+        item['time'].append((min(start + timedelta(seconds=seconds), stop) - EPOCH) // timedelta(milliseconds=1))
+        item['value'].append(value)
+    return list(series.values())
+
+
+@lru_cache(maxsize=128)
+def rollup_query(bucket, raw_bucket, shape, window, fn, with_raw):
+    # partial aggregates per area, agg and window; inner windows are stamped with their start
+    # so a window cut by the watermark keeps the same start on both sides
+    aggs = PARTS[fn]
+    expr = filter_expr(*shape)
+    agg_set = ", ".join(f'"{agg}"' for agg in aggs)
+    order = '|> sort(columns: ["_time"])' if fn == 'last' else ''  # grouped series are not in time order
+    sql = f"""rollup = from(bucket: "{bucket}")
+     |> range(start: params.start, stop: params.watermark)
+     |> filter(fn: (r) => {expr} and r._field == params.field and contains(value: r.agg, set: [{agg_set}]))
+     |> group(columns: ["area", "agg"])
+     {order}
+     |> aggregateWindow(every: {window}, fn: {MERGE_FUNCTIONS[aggs[0]]}, timeSrc: "_start", createEmpty: false)
+    """
+    if with_raw is False:
+        return sql + "rollup"
+
+    sql += f"""raw = from(bucket: "{raw_bucket}")
+     |> range(start: params.watermark, stop: params.stop)
+     |> filter(fn: (r) => {expr} and r._field == params.field)
+     |> group(columns: ["area"])
+     {order}
+    """
+    for agg in aggs:
+        sql += f"""raw_{agg} = raw
+     |> aggregateWindow(every: {window}, fn: {agg}, timeSrc: "_start", createEmpty: false)
+     |> set(key: "agg", value: "{agg}")
+     |> toFloat()
+    """
+    tables = ", ".join(['rollup'] + [f'raw_{agg}' for agg in aggs])
+    return sql + f"union(tables: [{tables}])"
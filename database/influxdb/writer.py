@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+from collections import deque
+from common.log import Logger
+from influxdb_client.rest import ApiException
+
+
+def is_rejected(err):
+    # the database refused the data itself, retrying will not help
+    return isinstance(err, ApiException) and err.status is not None and 400 <= err.status < 500 and err.status != 429
+
+
+class BatchWriter:
+    """
+    Buffer line protocol records and write them in batches, when the batch is full or the interval expires.
+    """
+    def __init__(self, name, write_func, batch_size=500, flush_interval=1.0, buffer_size=10000,
+                 max_retries=3, retry_interval=0.5, fallback=None):
+        self.write_func = write_func  # func(list of line protocol), raise when failed
+        self.fallback = fallback  # func(list of line protocol), keep the batch when all retries failed
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.flush_requested = False
+        self.running = False
+        self.thread = None
+        self.logger = Logger(prefix=f'batch writer {name}:')
+        # counters
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.retries = 0
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, line):
+        self.add_many([line])
+
+    def add_many(self, lines):
+        with self.cond:
+            for line in lines:
+                # bounded buffer, wait for the flush thread to make room
+                while len(self.buffer) >= self.buffer_size and self.running:
+                    self.cond.notify_all()
+                    self.cond.wait()
+                self.buffer.append(line)
+            if len(self.buffer) >= self.batch_size:
+                self.cond.notify_all()
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            self.flush_requested = True
+            self.cond.notify_all()
+            while len(self.buffer) > 0 or self.in_flight > 0:
+                remain = None if deadline is None else deadline - time.monotonic()
+                if remain is not None and remain <= 0:
+                    return False
+                if self.running is False:  # no flush thread, write on the caller
+                    break
+                self.cond.wait(remain)
+        if self.running is False:
+            self._drain()
+        return True
+
+    def close(self, timeout=None):
+        with self.cond:
+            if self.running is False:
+                return
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout)  # thread writes the rest of the buffer before exit
+        self.thread = None
+
+    def stats(self):
+        with self.cond:
+            return {
+                'buffered': len(self.buffer),
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches,
+                'retries': self.retries,
+            }
+
+    def _run(self):
+        while True:
+            with self.cond:
+                deadline = time.monotonic() + self.flush_interval
+                while self.running and not self.flush_requested and len(self.buffer) < self.batch_size:
+                    remain = deadline - time.monotonic()
+                    if remain <= 0:
+                        break
+                    self.cond.wait(remain)
+                if self.running is False and len(self.buffer) == 0:
+                    return
+                batch = self._take()
+            if len(batch) > 0:
+                self._write(batch)
+
+    def _drain(self):
+        while True:
+            with self.cond:
+                batch = self._take()
+            if len(batch) == 0:
+                return
+            self._write(batch)
+
+    def _take(self):
+        # called with cond held
+        n = min(self.batch_size, len(self.buffer))
+        batch = [self.buffer.popleft() for _ in range(n)]
+        if len(self.buffer) == 0:
+            self.flush_requested = False
+        self.in_flight += n
+        self.cond.notify_all()
+        return batch
+
+    def _write(self, batch):
+        ok = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.write_func(batch)
+                ok = True
+                break
+            except Exception as e:
+                if is_rejected(e):
+                    self.logger.error(f'batch rejected, status: {e.status}, reason: {e.reason}')
+                    break
+                err = e
+            if attempt == self.max_retries:
+                self.logger.error(f'batch write failed after {attempt} retries: {err}')
+                if self.fallback is not None:
+                    self.fallback(batch)
+                break
+            with self.cond:
+                self.retries += 1
+            # exponential backoff with jitter, avoid retrying in lockstep
+            time.sleep(self.retry_interval * (2 ** attempt) * random.uniform(0.5, 1.5))
+        self._done(batch, ok)
+        return ok
+
+    def _done(self, batch, ok):
+        with self.cond:
+            self.in_flight -= len(batch)
+            self.batches += 1
+            if ok:
+                self.written += len(batch)
+            else:
+                self.failed += len(batch)
+            self.cond.notify_all()
@@ -1,4 +1,8 @@
+import json
+import threading
+import time
 import constants.http as const_h
+import message_broker.channels as mb_channel
 from http import HTTPMethod
 from common.time import time_to_str
 
@@ -6,11 +10,17 @@ from common.time import time_to_str
 class Logic:
     def __init__(self, delegate):
         self.delegate = delegate
+        # certified list version: epoch changes on restart, version grows with each change event
+        self.epoch = time.time_ns()
+        self.version = 0
+        self.version_lock = threading.Lock()
 
     def register_handler(self):
         self.delegate.http_client.add_route(const_h.MYSQL_DEVICE_LIST, HTTPMethod.GET, self.list)
         self.delegate.http_client.add_route(const_h.MYSQL_DEVICE_COUNT, HTTPMethod.GET, self.count)
         self.delegate.http_client.add_route(const_h.MYSQL_DEVICE_CERTIFIED_LIST, HTTPMethod.GET, self.certified_list)
+        self.delegate.http_client.add_route(const_h.MYSQL_DEVICE_CERTIFIED_VERSION, HTTPMethod.GET,
+                                            self.certified_version)
         self.delegate.http_client.add_route(const_h.MYSQL_DEVICE_REGISTER, HTTPMethod.POST, self.register)
         self.delegate.http_client.add_route(const_h.MYSQL_DEVICE_APPROVE, HTTPMethod.POST, self.approve)
 
@@ -65,6 +75,9 @@ class Logic:
         }
 
     def certified_list(self, params):
+        # version is read first, changes after it are sent as events with a higher version
+        with self.version_lock:
+            epoch, version = self.epoch, self.version
         records = self.delegate.db_connect.query("select id, name from device where auth_status = 1")
         result = []
         for record in records:
@@ -74,9 +87,32 @@ class Logic:
             })
 
         return {
+            'epoch': epoch,
+            'version': version,
             'list': result
         }
 
+    def certified_version(self, params):
+        with self.version_lock:
+            return {
+                'epoch': self.epoch,
+                'version': self.version
+            }
+
+    def publish_change(self, name):
+        # current auth status of the device, sent on the internal certified channel
+        records = self.delegate.db_connect.query('select auth_status from device where name = %s limit 1', name)
+        certified = len(records) > 0 and records[0]['auth_status'] == 1
+        with self.version_lock:
+            self.version += 1
+            event = {
+                'epoch': self.epoch,
+                'version': self.version,
+                'name': name,
+                'certified': certified,
+            }
+            self.delegate.mqtt_publish(mb_channel.DEVICE_CERTIFIED, json.dumps(event))
+
     def register(self, params):
         name = params['name']
         area_name = params['area']
@@ -104,6 +140,7 @@ class Logic:
             args = (status, area_id, sensor, actuator, name)
 
         self.delegate.db_connect.insert(sql, args, is_create=is_create)
+        self.publish_change(name)
 
     def approve(self, params):
         if 'area_list' not in params or len(params['area_list']) == 0:
@@ -128,6 +165,7 @@ class Logic:
         sql = f'update device set auth_status = %s where name = %s and area_id in ({area_ids_str})'
         args = (status, name)
         self.delegate.db_connect.insert(sql, args)
+        self.publish_change(name)
 
         return {
             'code': 0,
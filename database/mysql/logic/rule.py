@@ -1,6 +1,11 @@
 import constants.http as const_h
+import message_broker.channels as mb_channel
 from http import HTTPMethod
 from common.time import time_to_str
+from database.mysql.logic.versioned import changed_rows, publish_change
+
+# window, window_size (samples), aggregate (mean, min, max), hysteresis and duration (seconds) of a rule condition
+CONDITION_COLUMNS = ['window', 'window_size', 'aggregate', 'hysteresis', 'duration']
 
 
 class Logic:
@@ -12,6 +17,7 @@ class Logic:
         self.delegate.http_client.add_route(const_h.MYSQL_RULE_COUNT, HTTPMethod.GET, self.count)
         self.delegate.http_client.add_route(const_h.MYSQL_RULE_SAVE, HTTPMethod.POST, self.save)
         self.delegate.http_client.add_route(const_h.MYSQL_RULE_RUNNING, HTTPMethod.POST, self.running)
+        self.delegate.http_client.add_route(const_h.MYSQL_RULE_CHANGES, HTTPMethod.GET, self.changes)
 
     def count(self, params):
         sql = 'select count(*) as total from rule'
@@ -66,21 +72,28 @@ class Logic:
         }
 
     def save(self, params):
+        # optional condition columns, only written when given
+        extra = [key for key in CONDITION_COLUMNS if key in params]
+        extra_args = tuple(params[key] for key in extra)
         is_create = False
         if 'id' not in params:
-            sql = ('INSERT INTO rule (src, entity, `field`, compare, value, dst, opt, is_deleted, `desc`)'
-                   'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)')
+            columns = ''.join([f', `{key}`' for key in extra])
+            holders = ''.join([', %s' for _ in extra])
+            sql = (f'INSERT INTO rule (src, entity, `field`, compare, value, dst, opt, is_deleted, `desc`{columns})'
+                   f'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s{holders})')
             args = (params['src'], params['entity'], params['field'],
                     params['compare'], params['value'], params['dst'],
-                    params['opt'], 0, params['desc'])
+                    params['opt'], 0, params['desc']) + extra_args
             is_create = True
         else:
-            sql = ('update rule set src=%s, entity=%s, `field`=%s, compare=%s, value=%s, dst=%s, opt=%s, `desc`=%s'
-                   ' where id=%s')
+            columns = ''.join([f' `{key}`=%s,' for key in extra])
+            sql = ('update rule set src=%s, entity=%s, `field`=%s, compare=%s, value=%s, dst=%s, opt=%s, `desc`=%s,'
+                   f'{columns} updated_at=now() where id=%s')
             args = (params['src'], params['entity'], params['field'],
                     params['compare'], params['value'], params['dst'],
-                    params['opt'], params['desc'], params['id'])
+                    params['opt'], params['desc']) + extra_args + (params['id'],)
         n = self.delegate.db_connect.insert(sql, args, is_create=is_create)
+        self.notify_change(n if is_create else params['id'])
         return {
             "row": n
         }
@@ -90,5 +103,12 @@ class Logic:
             is_deleted = 1
         else:
             is_deleted = 0
-        sql = 'update rule set is_deleted = %s where id = %s'
+        sql = 'update rule set is_deleted = %s, updated_at = now() where id = %s'
         self.delegate.db_connect.insert(sql, (is_deleted, params['id']))
+        self.notify_change(params['id'])
+
+    def changes(self, params):
+        return changed_rows(self.delegate.db_connect, 'rule', params.get('since', ''))
+
+    def notify_change(self, rule_id):
+        publish_change(self.delegate, mb_channel.RULE_CHANGED, rule_id)
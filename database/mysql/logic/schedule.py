@@ -1,6 +1,12 @@
 import constants.http as const_h
+import message_broker.channels as mb_channel
 from http import HTTPMethod
 from common.time import time_to_str
+from database.mysql.logic.versioned import changed_rows, publish_change
+
+# optional timing columns, see README
+TIMING_COLUMNS = ['cron', 'align', 'catch_up']
+STATE_CHUNK = 1000  # rows per insert when saving fire times
 
 
 class Logic:
@@ -12,6 +18,8 @@ class Logic:
         self.delegate.http_client.add_route(const_h.MYSQL_SCHEDULE_COUNT, HTTPMethod.GET, self.count)
         self.delegate.http_client.add_route(const_h.MYSQL_SCHEDULE_SAVE, HTTPMethod.POST, self.save)
         self.delegate.http_client.add_route(const_h.MYSQL_SCHEDULE_RUNNING, HTTPMethod.POST, self.running)
+        self.delegate.http_client.add_route(const_h.MYSQL_SCHEDULE_STATE, HTTPMethod.GET, self.state)
+        self.delegate.http_client.add_route(const_h.MYSQL_SCHEDULE_STATE, HTTPMethod.POST, self.save_state)
 
     def count(self, params):
         sql = 'select count(*) as total from schedule'
@@ -34,6 +42,8 @@ class Logic:
         }
 
     def list(self, params):
+        if 'inner' in params and 'since' in params:
+            return self.changes(params)
         sql = 'select * from schedule where 1=1'
         if 'inner' not in params:
             if 'device_list' not in params or len(params['device_list']) == 0:
@@ -63,17 +73,24 @@ class Logic:
         }
 
     def save(self, params):
+        extra = [key for key in TIMING_COLUMNS if key in params]
+        extra_args = tuple(params[key] for key in extra)
+        duration = params.get('duration', 0)  # may be 0 when a cron expression is given
         is_create = False
         if 'id' not in params:
-            sql = ('INSERT INTO schedule (target, opt, duration, is_deleted)'
-                   'VALUES (%s, %s, %s, %s)')
-            args = (params['target'], params['opt'], params['duration'], 0)
+            columns = ''.join([f', `{key}`' for key in extra])
+            holders = ''.join([', %s' for _ in extra])
+            sql = (f'INSERT INTO schedule (target, opt, duration, is_deleted{columns})'
+                   f'VALUES (%s, %s, %s, %s{holders})')
+            args = (params['target'], params['opt'], duration, 0) + extra_args
             is_create = True
         else:
-            sql = ('update schedule set target=%s, opt=%s, `duration`=%s'
-                   ' where id=%s')
-            args = (params['target'], params['opt'], params['duration'], params['id'])
+            columns = ''.join([f', `{key}`=%s' for key in extra])
+            sql = (f'update schedule set target=%s, opt=%s, `duration`=%s{columns},'
+                   ' updated_at=now() where id=%s')
+            args = (params['target'], params['opt'], duration) + extra_args + (params['id'],)
         n = self.delegate.db_connect.insert(sql, args, is_create=is_create)
+        self.notify_change(n if is_create else params['id'])
         return {
             "row": n
         }
@@ -83,5 +100,39 @@ class Logic:
             is_deleted = 1
         else:
             is_deleted = 0
-        sql = 'update schedule set is_deleted = %s where id = %s'
+        sql = 'update schedule set is_deleted = %s, updated_at = now() where id = %s'
         self.delegate.db_connect.insert(sql, (is_deleted, params['id']))
+        self.notify_change(params['id'])
+
+    def changes(self, params):
+        return changed_rows(self.delegate.db_connect, 'schedule', params.get('since', ''))
+
+    def notify_change(self, schedule_id):
+        publish_change(self.delegate, mb_channel.SCHEDULE_CHANGED, schedule_id)
+
+    def state(self, params):
+        # fire times saved by the schedule service, epoch seconds
+        sql = 'select schedule_id, last_fire_at, next_fire_at, timing from schedule_state'
+        records = self.delegate.db_connect.query(sql)
+
+        return {
+            'list': records
+        }
+
+    def save_state(self, params):
+        rows = params.get('list', [])
+        n = 0
+        for i in range(0, len(rows), STATE_CHUNK):
+            chunk = rows[i:i + STATE_CHUNK]
+            holders = ', '.join(['(%s, %s, %s, %s)' for _ in chunk])
+            sql = ('INSERT INTO schedule_state (schedule_id, last_fire_at, next_fire_at, timing) VALUES '
+                   f'{holders} ON DUPLICATE KEY UPDATE last_fire_at=VALUES(last_fire_at),'
+                   ' next_fire_at=VALUES(next_fire_at), timing=VALUES(timing)')
+            args = []
+            for row in chunk:
+                args.extend([row['schedule_id'], row['last_fire_at'], row['next_fire_at'], row['timing']])
+            n += self.delegate.db_connect.insert(sql, args)
+
+        return {
+            "row": n
+        }
@@ -0,0 +1,28 @@
+import json
+from common.time import time_to_str
+
+
+def changed_rows(db_connect, table, since=''):
+    # rows with updated_at at or after the version (since), deleted ones included so they can be removed;
+    # the version is the newest updated_at, rows of the same second are sent again next time
+    version = since
+    sql = f'select * from {table}'
+    args = None
+    if version != '':
+        sql += ' where updated_at >= %s'
+        args = version
+    records = db_connect.query(sql + ' order by updated_at', args)
+    for i in range(len(records)):
+        records[i]['created_at'] = time_to_str(records[i]['created_at'])
+        records[i]['updated_at'] = time_to_str(records[i]['updated_at'])
+        version = max(version, records[i]['updated_at'])
+
+    return {
+        'version': version,
+        'list': records
+    }
+
+
+def publish_change(delegate, channel, row_id):
+    # the service following the table fetches the changes right away instead of waiting for its next check
+    delegate.mqtt_publish(channel, json.dumps({'id': row_id}))
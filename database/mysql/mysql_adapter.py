@@ -23,9 +23,11 @@ class MysqlAdapter(BaseService):
 
     def start(self):
         super().start()
+        self.init_mqtt_client()  # certified device change events
         self.init_http_client(host=self.host, port=self.port)
 
     def stop(self):
+        self.remove_mqtt_client()
         self.remove_http_client()
 
     def register_http_service(self):
@@ -1,6 +1,7 @@
 import os
 import time
 from devices.area.device import Device
+from common.codec import CODEC_JSON
 from common.config import ConfigLoader
 
 
@@ -8,12 +9,16 @@ class Area:
     def __init__(self, params):
         self.name = params['area_name']
         self.soil_type = params['soil_type']
+        self.batch_size = int(params.get('batch_size', 0))  # readings per data message, 0 sends each one
+        self.codec = params.get('codec', CODEC_JSON)  # payload encoding, json or msgpack
         self.device_list = []
         for device_name in params['devices']:
             d = Device(self, {
                 'area_name': self.name,
                 'soil_type': self.soil_type,
                 'device_name': device_name,
+                'batch_size': self.batch_size,
+                'codec': self.codec,
                 'items': params['devices'][device_name]
             })
             d.start()
@@ -35,6 +40,8 @@ class AreaController:
             a = Area({
                 'area_name': name,
                 'soil_type': config['area'][name]['soil_type'],
+                'batch_size': config['area'][name].get('batch_size', 0),
+                'codec': config['area'][name].get('codec', CODEC_JSON),
                 'devices': config[name]
             })
             self.area_list.append(a)
@@ -1,4 +1,5 @@
 import json
+from common.codec import CODEC_JSON
 from devices.biz.base_device import BaseDevice
 from devices.sensor.base import get_sensor
 from devices.actuator.base import get_actuator
@@ -6,7 +7,8 @@ from devices.actuator.base import get_actuator
 
 class Device(BaseDevice):
     def __init__(self, delegate, params):
-        super().__init__(params['area_name'], params['device_name'])
+        super().__init__(params['area_name'], params['device_name'], batch_size=params.get('batch_size', 0),
+                         codec=params.get('codec', CODEC_JSON))
         self.delegate = delegate
         items = params['items']
         if 'sensor' in items:
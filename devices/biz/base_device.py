@@ -6,10 +6,13 @@ import message_broker.channels as mb_channel
 import threading
 from common.log import Logger
 from common.mqtt import MQTTClient
+from common.codec import CODEC_JSON, encode, with_device
+from common.telemetry import batch_message
 
 
 class BaseDevice:
-    def __init__(self, area_name, name, broker="43.131.48.203", port=1883):
+    def __init__(self, area_name, name, broker="43.131.48.203", port=1883, batch_size=0, batch_interval=10.0,
+                 codec=CODEC_JSON):
         # meta
         self.area_name = area_name
         self.device_name = name
@@ -22,6 +25,12 @@ class BaseDevice:
         self.data_topic = mb_channel.DEVICE_DATA
         self.command_topic = mb_channel.DEVICE_COMMAND + name
         self.operation_topic = mb_channel.DEVICE_OPERATION
+        self.codec = codec  # payload encoding of data and operation messages
+        # batch_size = 0 publishes every reading on its own
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval  # max seconds a reading waits in the batch
+        self.batch_lock = threading.Lock()
+        self.batch = {}  # measurement -> (first reading time, [(fields, time ns)])
         # func
         self.sensor = None
         self.actuator = None
@@ -34,6 +43,7 @@ class BaseDevice:
         self.logger.info("device start")
 
     def stop(self):
+        self.flush_data()
         self.remove_mqtt_client()
         self._set_working(False)
         self.logger.info("device stop")
@@ -68,14 +78,37 @@ class BaseDevice:
         return True, ""
 
     def record_data(self, measurement, data):
-        mqtt_data = {
-            'tags': {
-                'area': self.area_name,
-                'device': self.device_name,
-            },
-            'fields': data,
+        tags = {
+            'area': self.area_name,
+            'device': self.device_name,
         }
-        self.mqtt_publish(self.data_topic + measurement, json.dumps(mqtt_data))
+        if self.batch_size <= 0:
+            mqtt_data = {
+                'tags': tags,
+                'fields': data,
+            }
+            self.mqtt_publish(self.data_topic + measurement, self.encode(mqtt_data))
+            return
+
+        # readings keep their own time and are published together
+        with self.batch_lock:
+            started_at, samples = self.batch.setdefault(measurement, (time.monotonic(), []))
+            samples.append((data, time.time_ns()))
+            if len(samples) < self.batch_size and time.monotonic() - started_at < self.batch_interval:
+                return
+            del self.batch[measurement]
+        self.mqtt_publish(self.data_topic + measurement, self.encode(batch_message(tags, samples)))
+
+    def flush_data(self):
+        with self.batch_lock:
+            batch = self.batch
+            self.batch = {}
+        tags = {
+            'area': self.area_name,
+            'device': self.device_name,
+        }
+        for measurement, (_, samples) in batch.items():
+            self.mqtt_publish(self.data_topic + measurement, self.encode(batch_message(tags, samples)))
 
     def record_operation(self, message):
         mqtt_data = {
@@ -85,7 +118,11 @@ class BaseDevice:
             },
             'fields': message,
         }
-        self.mqtt_publish(self.operation_topic, json.dumps(mqtt_data))
+        self.mqtt_publish(self.operation_topic, self.encode(mqtt_data))
+
+    def encode(self, mqtt_data):
+        # device header first, auth service forwards without decoding the message
+        return with_device(encode(mqtt_data, self.codec), self.device_name)
 
     def _handle_command(self, client, userdata, msg):
         content = msg.payload.decode('utf-8')
@@ -9,3 +9,8 @@ DEVICE_STATUS = _PREFIX + "device/status/"  # channel for device status
 # between service and database
 STORAGE_DATA = _PREFIX + "storage/data/"  # channel for data storage
 STORAGE_OPERATION = _PREFIX + "storage/operation/"  # channel for operation storage
+
+# between services
+DEVICE_CERTIFIED = _PREFIX + "internal/device/certified"  # channel for certified device changes
+RULE_CHANGED = _PREFIX + "internal/rule/changed"  # channel for rule change notification
+SCHEDULE_CHANGED = _PREFIX + "internal/schedule/changed"  # channel for schedule change notification
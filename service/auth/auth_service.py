@@ -1,5 +1,4 @@
 import json
-import time
 import constants.entity
 import constants.http
 import message_broker.channels as mb_channel
@@ -7,6 +6,7 @@ import requests
 import threading
 
 from common.base_service import BaseService
+from common.codec import decode, peek_device
 
 
 class AuthService(BaseService):
@@ -16,7 +16,13 @@ class AuthService(BaseService):
         self.data_storage_channel = mb_channel.STORAGE_DATA  # channel for store data
         self.operation_channel = mb_channel.DEVICE_OPERATION  # channel for get operation
         self.operation_storage_channel = mb_channel.STORAGE_OPERATION  # channel for store operation
-        self.certified_list = []  # verified device
+        self.certified_channel = mb_channel.DEVICE_CERTIFIED  # channel for certified device changes
+        self.certified = frozenset()  # names of verified devices, replaced as a whole on each change
+        self.certified_epoch = None  # version of the list from the mysql adapter
+        self.certified_version = None
+        self.certified_lock = threading.Lock()
+        self.pending_events = None  # events received while a full resync is running
+        self.resync_event = threading.Event()
         self.mysql_base_url = f'{constants.http.MYSQL_HOST}:{constants.http.SERVICE_PORT_MYSQL}'
         self.running = False
 
@@ -24,38 +30,97 @@ class AuthService(BaseService):
         super().start()
         self.running = True
         threading.Thread(target=self._get_certified_device).start()
-        self.init_mqtt_client()
+        self.init_mqtt_client(workers=4)  # slow handlers must not block the network loop
 
     def stop(self):
         self.running = False
+        self.resync_event.set()
         self.remove_mqtt_client()
         self.remove_http_client()
 
     def _get_certified_device(self):
-        # reload certified list each 60 seconds
+        # full list once, then change events; the version is checked each 60 seconds
+        # and the list is only loaded again when events were missed
+        need_resync = True
         while self.running:
+            try:
+                if need_resync:
+                    self.resync_certified()
+                resp = requests.get(self.mysql_base_url + constants.http.MYSQL_DEVICE_CERTIFIED_VERSION)
+                resp_data = resp.json()
+                with self.certified_lock:
+                    need_resync = (resp_data['epoch'] != self.certified_epoch or
+                                   resp_data['version'] > self.certified_version)
+            except Exception as e:
+                self.logger.error(f'certified device sync failed: {e}')
+                need_resync = True
+                self.resync_event.wait(5)
+                self.resync_event.clear()
+                continue
+            if need_resync is False:
+                self.resync_event.wait(60)
+                need_resync = self.resync_event.is_set()  # woken up by a missed event
+            self.resync_event.clear()
+
+    def resync_certified(self):
+        with self.certified_lock:
+            self.pending_events = []
+        try:
             resp = requests.get(self.mysql_base_url + constants.http.MYSQL_DEVICE_CERTIFIED_LIST)
             resp_data = resp.json()
-            self.certified_list = resp_data['list']
-            time.sleep(60)
+        except Exception:
+            with self.certified_lock:
+                self.pending_events = None
+            raise
+
+        with self.certified_lock:
+            self.certified = frozenset(item['name'] for item in resp_data['list'])
+            self.certified_epoch = resp_data['epoch']
+            self.certified_version = resp_data['version']
+            pending = sorted(self.pending_events, key=lambda e: e['version'])
+            self.pending_events = None
+            for event in pending:
+                self._apply_change(event)
+        self.logger.info(f'certified devices: {len(self.certified)}, version: {self.certified_version}')
+
+    def mqtt_certified(self, client, userdata, msg):
+        event = json.loads(msg.payload.decode('utf-8'))
+        with self.certified_lock:
+            if self.pending_events is not None:  # applied once the resync is done
+                self.pending_events.append(event)
+                return
+            self._apply_change(event)
+
+    def _apply_change(self, event):
+        # called with certified_lock held
+        if event['epoch'] != self.certified_epoch or event['version'] > self.certified_version + 1:
+            self.resync_event.set()  # missed events or mysql adapter restarted
+            return
+        if event['version'] <= self.certified_version:  # already in the list
+            return
+        if event['certified']:
+            self.certified = self.certified | {event['name']}
+        else:
+            self.certified = self.certified - {event['name']}
+        self.certified_version = event['version']
 
     def register_mqtt_service(self):
         # device data
         self.mqtt_listen(self.data_channel + '+', self.mqtt_data)
         # device operation
         self.mqtt_listen(self.operation_channel, self.mqtt_operation)
+        # certified device changes
+        self.mqtt_listen(self.certified_channel, self.mqtt_certified)
 
     def is_certified(self, name):
-        for item in self.certified_list:
-            if name == item['name']:
-                return True
-        return False
+        return name in self.certified
 
     def mqtt_data(self, client, userdata, msg):
         if self.do_verify(msg) is False:
             return
 
         entity = msg.topic.removeprefix(self.data_channel)
+        # a batch envelope carries one device, it is forwarded as one message
         self.mqtt_publish(self.data_storage_channel + entity, msg.payload)
 
     def mqtt_operation(self, client, userdata, msg):
@@ -65,10 +130,19 @@ class AuthService(BaseService):
         self.mqtt_publish(self.operation_storage_channel, msg.payload)
 
     def do_verify(self, msg):
-        content = msg.payload.decode('utf-8')
-        data_dict = json.loads(content)
+        # fast path: device name from the header, the message itself is not decoded;
+        # the header is written by BaseDevice from the same name as tags.device, the consumers
+        # (decode_device) drop messages where the two differ
+        name = peek_device(msg.payload)
+        if name is not None:
+            if self.is_certified(name) is False:
+                self.logger.warning(f'device: {name}, is not certified')
+                return False
+            return True
+
+        data_dict = decode(msg.payload)
         if 'tags' not in data_dict or 'device' not in data_dict['tags']:
-            self.logger.warning(f'topic {msg.topic} message without device, content: {content}')
+            self.logger.warning(f'topic {msg.topic} message without device, content: {data_dict}')
             return False
 
         name = data_dict['tags']['device']
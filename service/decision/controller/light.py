@@ -74,14 +74,12 @@ class LightController(BaseController):
         """
         Turn off the light after sunrise.
         """
-        self.delegate.mqtt_publish(self.delegate.command_channel + device_name,
-                                   json.dumps({"type": "action", "status": False}))
+        self.delegate.publish_command(device_name, json.dumps({"type": "action", "status": False}))
         self.light_on = False
 
     def trigger_sunset_action(self, device_name):
         """
         Turn on the light after sunset.
         """
-        self.delegate.mqtt_publish(self.delegate.command_channel + device_name,
-                                   json.dumps({"type": "action", "status": True}))
+        self.delegate.publish_command(device_name, json.dumps({"type": "action", "status": True}))
         self.light_on = True
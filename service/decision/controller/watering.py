@@ -5,7 +5,6 @@ import threading
 import pandas as pd
 import constants.const as const
 import constants.http as const_h
-import message_broker.channels as mb_channel
 from datetime import datetime
 from common.log import Logger
 from common.time import time_add
@@ -54,19 +53,29 @@ class DataFetcher:
         self.delegate.area_list = resp.json()['list']
 
     def get_sensor_data(self):
-        params = {'inner': True}
         need_measurements = ['humidity', 'temperature', 'soil']
+        params = {
+            'inner': True,
+            'measurement_list': need_measurements,
+            'area_list': [area['name'] for area in self.delegate.area_list]
+        }
+        # newest value of every area and measurement in one call
+        resp = requests.get(self.delegate.latest_api_url, params)
+        data_list = resp.json()['list']
+        latest = {}
+        for item in data_list:
+            key = (item['area'], item['measurement'])
+            if key not in latest or latest[key]['created_at'] < item['created_at']:
+                latest[key] = item
+
         sensor_data = {}
         for measurement in need_measurements:
             for area in self.delegate.area_list:
-                params['measurement'] = measurement
-                params['area_list'] = [area['name']]
-                resp = requests.get(self.delegate.sensor_api_url, params)
-                data_list = resp.json()['list']
-                if data_list is None or len(data_list) == 0:
+                item = latest.get((area['name'], measurement))
+                if item is None or item.get('value') is None:
                     sensor_data[(area['id'], measurement)] = None
                     continue
-                sensor_data[(area['id'], measurement)] = float(data_list[0]['value'])
+                sensor_data[(area['id'], measurement)] = float(item['value'])
         self.delegate.sensor_data = sensor_data
 
     def get_history_weather(self):
@@ -147,8 +156,8 @@ class WateringController(BaseController):
         self.weather_api_url = delegate.weather_api_url
         # self.sensor_api_url = delegate.config.get("./sensor/api_url")
         self.sensor_api_url = f'{const_h.INFLUX_HOST}:{const_h.SERVICE_PORT_INFLUX}{const_h.INFLUX_DATA_GET}'
+        self.latest_api_url = f'{const_h.INFLUX_HOST}:{const_h.SERVICE_PORT_INFLUX}{const_h.INFLUX_DATA_LATEST}'
         self.data_source = DataFetcher(self)
-        self.command_channel = mb_channel.DEVICE_COMMAND
 
     def handle_data(self, data):
         # current data
@@ -164,12 +173,12 @@ class WateringController(BaseController):
             'status': True
         }
         for device in device_list:
-            self.delegate.mqtt_publish(self.command_channel + device['name'], json.dumps(params))
+            self.delegate.publish_command(device['name'], json.dumps(params))
         time.sleep(duration)
         # irrigator off
         params['status'] = False
         for device in device_list:
-            self.delegate.mqtt_publish(self.command_channel + device['name'], json.dumps(params))
+            self.delegate.publish_command(device['name'], json.dumps(params))
 
     def handle_check(self):
         for area in self.area_list:
@@ -7,7 +7,6 @@ import threading
 import constants.entity
 import constants.const as const
 import constants.http as const_h
-import message_broker.channels as mb_channel
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
@@ -91,10 +90,10 @@ class ThresholdCalculator:
 
 
 class DecisionService(BaseService):
-    def __init__(self):
-        super().__init__(constants.entity.DECISION_SERVICE)
+    def __init__(self, command_window=60.0):
+        # controllers re-check every cycle, the same light or irrigator state is sent once per window
+        super().__init__(constants.entity.DECISION_SERVICE, command_window=command_window)
         self.control_groups = []
-        self.command_channel = mb_channel.DEVICE_COMMAND
         config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'configuration.xml')
         self.config = ConfigLoader(config_path)
         self.weather_api_url = self.config.get("./weather/api_url")
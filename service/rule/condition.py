@@ -0,0 +1,121 @@
+from collections import deque
+
+import constants.rule as const
+from service.rule.converter import convert_checker
+
+AGGREGATE_MEAN = 'mean'
+AGGREGATE_MIN = 'min'
+AGGREGATE_MAX = 'max'
+# compare used to leave the active state when a hysteresis band is set
+RELEASE_COMPARE = {
+    const.COMPARE_GREATER_THAN: (const.COMPARE_LESS_THAN, -1),
+    const.COMPARE_GREATER_THAN_EQUAL: (const.COMPARE_LESS_THAN, -1),
+    const.COMPARE_LESS_THAN: (const.COMPARE_GREATER_THAN, 1),
+    const.COMPARE_LESS_THAN_EQUAL: (const.COMPARE_GREATER_THAN, 1),
+}
+
+
+class Window:
+    """
+    Sliding window over the last `size` samples or `seconds` of time, amortized O(1) per sample:
+    running sum for the mean, monotonic queues for min and max.
+    """
+    def __init__(self, size=0, seconds=0.0):
+        self.size = size
+        self.seconds = seconds
+        self.samples = deque()  # (seq, time, value)
+        self.min_queue = deque()  # (seq, value), values increasing
+        self.max_queue = deque()  # (seq, value), values decreasing
+        self.total = 0.0
+        self.seq = 0
+
+    def add(self, value, at):
+        self.seq += 1
+        self.samples.append((self.seq, at, value))
+        self.total += value
+        while len(self.min_queue) > 0 and self.min_queue[-1][1] >= value:
+            self.min_queue.pop()
+        self.min_queue.append((self.seq, value))
+        while len(self.max_queue) > 0 and self.max_queue[-1][1] <= value:
+            self.max_queue.pop()
+        self.max_queue.append((self.seq, value))
+
+        while len(self.samples) > 0 and self._expired(self.samples[0], at):
+            seq, _, old = self.samples.popleft()
+            self.total -= old
+            if self.min_queue[0][0] == seq:
+                self.min_queue.popleft()
+            if self.max_queue[0][0] == seq:
+                self.max_queue.popleft()
+
+    def _expired(self, sample, at):
+        if self.size > 0 and len(self.samples) > self.size:
+            return True
+        return self.seconds > 0 and at - sample[1] > self.seconds
+
+    def value(self, fn):
+        if fn == AGGREGATE_MIN:
+            return self.min_queue[0][1]
+        if fn == AGGREGATE_MAX:
+            return self.max_queue[0][1]
+        return self.total / len(self.samples)
+
+
+class Condition:
+    """
+    State of one rule: the compared value (raw or aggregated over a window) has to match,
+    optionally for at least `duration` seconds, and the rule stays active until the value
+    leaves the hysteresis band. update() is True only when the rule becomes active.
+    optional rule keys: window (seconds), window_size (samples), aggregate (mean, min, max),
+    hysteresis (band below/above the compare value), duration (seconds)
+    """
+    def __init__(self, rule, checker):
+        self.checker = checker
+        self.aggregate = rule.get('aggregate') or AGGREGATE_MEAN
+        self.window = None
+        window = float(rule.get('window') or 0)
+        window_size = int(rule.get('window_size') or 0)
+        if window > 0 or window_size > 0:
+            self.window = Window(window_size, window)
+        self.duration = float(rule.get('duration') or 0)
+        self.release = None
+        hysteresis = float(rule.get('hysteresis') or 0)
+        if hysteresis > 0 and rule['compare'] in RELEASE_COMPARE and isinstance(rule['value'], (int, float)):
+            compare, sign = RELEASE_COMPARE[rule['compare']]
+            self.release = convert_checker(compare, float(rule['value']) + sign * hysteresis)
+        self.active = False
+        self.since = None  # time the value started to match, for duration
+
+    def update(self, value, at):
+        # returns (becomes active, ok)
+        if self.window is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return False, False
+            self.window.add(value, at)
+            value = self.window.value(self.aggregate)
+
+        match, ok = self.checker(value)
+        if ok is False:
+            return False, False
+
+        if self.active:
+            if self.release is not None:
+                released, _ = self.release(value)
+            else:
+                released = match is False
+            if released:
+                self.active = False
+                self.since = None
+            return False, True
+
+        if match is False:
+            self.since = None
+            return False, True
+        if self.since is None:
+            self.since = at
+        if at - self.since < self.duration:
+            return False, True
+        self.active = True
+        return True, True
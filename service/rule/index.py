@@ -0,0 +1,72 @@
+from service.rule.condition import Condition
+from service.rule.converter import convert_checker, convert_message
+
+# keys the condition state depends on, a change of any other key keeps the state
+STATE_KEYS = ['entity', 'src', 'field', 'compare', 'value', 'window', 'window_size', 'aggregate', 'hysteresis',
+              'duration']
+
+
+class CompiledRule:
+    __slots__ = ('rule', 'field', 'checker', 'condition', 'target', 'message', 'ok')
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.field = rule['field']  # compare field
+        self.checker = convert_checker(rule['compare'], rule['value'])  # compare function
+        self.condition = Condition(rule, self.checker)  # window, hysteresis and duration state
+        self.target, self.message, self.ok = convert_message(rule['dst'], rule['opt'])  # command to send
+
+
+class RuleIndex:
+    """
+    Rules compiled once when loaded or changed and grouped by (entity, src device),
+    a message is only checked against the rules of its own entity and device.
+    """
+    def __init__(self, rule_list=()):
+        index = {}
+        self.keys = {}  # rule id -> (entity, src)
+        for rule in rule_list:
+            if rule.get('is_deleted', 0) == 1:
+                continue
+            index.setdefault((rule['entity'], rule['src']), []).append(CompiledRule(rule))
+            if 'id' in rule:
+                self.keys[rule['id']] = (rule['entity'], rule['src'])
+        self.index = {key: tuple(rules) for key, rules in index.items()}
+        self.size = sum(len(rules) for rules in self.index.values())
+
+    def get(self, entity, device):
+        return self.index.get((entity, device), ())
+
+    def patch(self, rule_list):
+        # changed rules replace their old version, deleted ones are removed; each key gets a new tuple,
+        # so a message being checked keeps the tuple it started with. Rows sent again unchanged are
+        # skipped and a rule whose condition keys are unchanged keeps its condition state.
+        for rule in rule_list:
+            old = self._find(rule['id'])
+            if old is not None and old.rule == rule:
+                continue
+            old_key = self.keys.pop(rule['id'], None)
+            if old_key is not None:
+                rules = tuple(c for c in self.index[old_key] if c.rule.get('id') != rule['id'])
+                self._set(old_key, rules)
+            if rule.get('is_deleted', 0) == 1:
+                continue
+            compiled = CompiledRule(rule)
+            if old is not None and all(old.rule.get(k) == rule.get(k) for k in STATE_KEYS):
+                compiled.condition = old.condition
+            key = (rule['entity'], rule['src'])
+            self._set(key, self.index.get(key, ()) + (compiled,))
+            self.keys[rule['id']] = key
+
+    def _find(self, rule_id):
+        key = self.keys.get(rule_id)
+        if key is None:
+            return None
+        return next((c for c in self.index[key] if c.rule.get('id') == rule_id), None)
+
+    def _set(self, key, rules):
+        self.size += len(rules) - len(self.index.get(key, ()))
+        if len(rules) == 0:
+            self.index.pop(key, None)
+        else:
+            self.index[key] = rules
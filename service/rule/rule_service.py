@@ -1,83 +1,136 @@
-import json
 import threading
 import time
 
-import requests
-
 import constants.entity
 import constants.rule
 import constants.http as const_h
 import message_broker.channels as mb_channel
 
 from common.base_service import BaseService
-from service.rule.converter import convert_checker, convert_message
+from common.change_feed import ChangeFeed
+from common.codec import decode_device
+from common.telemetry import get_samples
+from service.rule.index import RuleIndex
+from service.rule.vector import VectorRules, is_vector_rule
 from service.user.logic.base import Common
 
 
 class RuleService(BaseService):
-    def __init__(self):
-        super().__init__(constants.entity.RULE_SERVICE)
+    def __init__(self, batch_window=0.0, command_window=10.0):
+        # rules are edge triggered already, the window only merges rules commanding the same target
+        super().__init__(constants.entity.RULE_SERVICE, command_window=command_window)
         self.data_channel = mb_channel.DEVICE_DATA  # channel for get data
-        self.command_channel = mb_channel.DEVICE_COMMAND  # channel for send command
+        self.rule_changed_channel = mb_channel.RULE_CHANGED  # channel for rule change notification
         self.mysql_base_url = f'{const_h.MYSQL_HOST}:{const_h.SERVICE_PORT_MYSQL}'
-        self.rule_list = demo_rule()
+        self.rule_index = RuleIndex(demo_rule())  # replaced on the first load, then patched with changes
+        # rule changes each 60 seconds, or right after a change notification
+        self.rule_feed = ChangeFeed('rule', self.mysql_base_url + const_h.MYSQL_RULE_CHANGES, self.apply_rules, 60)
+        # batch_window > 0: threshold rules are checked in micro batches of that many seconds
+        self.batch_window = batch_window
+        self.vector_rules = VectorRules([])
+        self.vector_lock = threading.Lock()
+        self.pending = []  # (entity, device, fields) waiting for the next batch
+        self.pending_lock = threading.Lock()
         self.inner_service = Common(self)
 
     def start(self):
         super().start()
         self.init_mqtt_client()
-        threading.Thread(target=self.get_rule_list).start()
+        threading.Thread(target=self.rule_feed.run).start()
+        if self.batch_window > 0:
+            threading.Thread(target=self.run_batches, daemon=True).start()
 
     def stop(self):
         self.remove_mqtt_client()
 
-    def get_rule_list(self):
-        while True:
-            params = {
-                'inner': True,
-                'is_deleted': 0
-            }
-            resp = requests.get(self.mysql_base_url + const_h.MYSQL_RULE_LIST, params)
-            self.rule_list = resp.json()['list']
-            time.sleep(60)
+    def apply_rules(self, rule_list, full):
+        if self.batch_window <= 0:
+            if full:
+                self.rule_index = RuleIndex(rule_list)
+            else:
+                self.rule_index.patch(rule_list)
+            return
+
+        # batch mode: threshold rules go to the vector engine, the others stay in the index
+        if full:
+            self.rule_index = RuleIndex([r for r in rule_list if is_vector_rule(r) is False])
+            vector_rules = [r for r in rule_list if is_vector_rule(r)]
+            with self.vector_lock:
+                self.vector_rules = VectorRules(vector_rules, self.vector_rules)
+            return
+
+        self.rule_index.patch([dict(r, is_deleted=1) if is_vector_rule(r) else r for r in rule_list])
+        with self.vector_lock:
+            self.vector_rules.patch(rule_list)
 
     def register_mqtt_service(self):
         # device data
         self.mqtt_listen(self.data_channel + '+', self.mqtt_data)
+        # rule changes
+        self.mqtt_listen(self.rule_changed_channel, self.mqtt_rule_changed)
+
+    def mqtt_rule_changed(self, client, userdata, msg):
+        self.rule_feed.notify()
 
     def mqtt_data(self, client, userdata, msg):
         entity = msg.topic.removeprefix(self.data_channel)
-        content = msg.payload.decode('utf-8')
-        data_dict = json.loads(content)
-        # when [entity] do ([entity.field] <compare> [value]) if true then {opt}
-        for r in self.rule_list:
-            if entity != r['entity']:  # rule not match
+        data_dict = decode_device(msg.payload)
+        if data_dict is None:
+            self.logger.warning(f'topic {msg.topic} message device differs from its header, dropped')
+            return
+        # a batch envelope is checked sample by sample, in order
+        now = time.time()
+        samples = get_samples(data_dict)
+        for fields, at in samples:
+            self.check_rules(entity, data_dict, fields, at / 1e9 if at is not None else now)
+        if self.batch_window > 0 and "device" in data_dict.get("tags", {}):
+            device = data_dict["tags"]["device"]
+            with self.pending_lock:
+                self.pending.extend([(entity, device, fields) for fields, _ in samples])
+
+    def run_batches(self):
+        while True:
+            time.sleep(self.batch_window)
+            with self.pending_lock:
+                samples = self.pending
+                self.pending = []
+            if len(samples) == 0:
                 continue
-            if ("tags" not in data_dict or
-                    "device" not in data_dict['tags'] or
-                    r['src'] != data_dict["tags"]["device"]):  # device not match
+            try:
+                with self.vector_lock:
+                    commands = self.vector_rules.evaluate(samples)
+            except Exception as e:
+                self.logger.error(f'batch rule check failed: {e}')
                 continue
+            # one command per target and batch
+            for target, (msg, r) in commands.items():
+                self.logger.info(f'device: "{r["src"]}", match rule: {r}, batch of {len(samples)} samples')
+                self.publish_command(target, msg)
 
-            compare = r['compare']  # comparison symbol
+    def check_rules(self, entity, data_dict, fields, at):
+        # when [entity] do ([entity.field] <compare> [value]) if true then {opt}
+        if "tags" not in data_dict or "device" not in data_dict['tags']:
+            return
+        for compiled in self.rule_index.get(entity, data_dict["tags"]["device"]):
+            r = compiled.rule
+            if compiled.field not in fields:
+                continue
+            data_val = fields[compiled.field]  # real value
             compare_val = r['value']  # compare value
-            field = r['field']  # compare field
-            data_val = data_dict['fields'][field]  # real value
-            opt = r['opt']  # operate
 
-            checker = convert_checker(compare, compare_val)  # compare function
-            match, ok = checker(data_val)  # compare result
+            # command only when the rule becomes active, not on every matching sample
+            match, ok = compiled.condition.update(data_val, at)
             if ok is False:
                 self.logger.error(f'invalid rule: {r}, data value: {data_val}, compare value: {compare_val}')
                 continue
             if match:
-                target, msg, ok = convert_message(r['dst'], opt)
-                if ok is False:
+                if compiled.ok is False:
                     self.logger.error(f'convert message false, rule: {r},'
                                       f'data value: {data_val}, compare value: {compare_val}')
                     continue
                 self.logger.info(f'device: "{r["src"]}", match rule: {r},'
                                  f'data value: {data_val}, compare value: {compare_val}')
-                self.mqtt_publish(self.command_channel+target, msg)
+                self.publish_command(compiled.target, compiled.message)
 
 
 def demo_rule() -> list:
@@ -0,0 +1,148 @@
+import operator
+
+import numpy as np
+
+import constants.rule as const
+from service.rule.converter import convert_message
+
+OPERATORS = {
+    const.COMPARE_EQUAL: operator.eq,
+    const.COMPARE_NOT_EQUAL: operator.ne,
+    const.COMPARE_GREATER_THAN: operator.gt,
+    const.COMPARE_GREATER_THAN_EQUAL: operator.ge,
+    const.COMPARE_LESS_THAN: operator.lt,
+    const.COMPARE_LESS_THAN_EQUAL: operator.le,
+}
+STATE_KEYS = ['window', 'window_size', 'hysteresis', 'duration']
+
+
+def is_vector_rule(rule):
+    # plain numeric threshold rules, the ones with state or text values stay on the per message path
+    if 'id' not in rule or rule['compare'] not in OPERATORS:
+        return False
+    if isinstance(rule['value'], bool) or isinstance(rule['value'], (int, float)) is False:
+        return False
+    if any(rule.get(key) for key in STATE_KEYS):
+        return False
+    return convert_message(rule['dst'], rule['opt'])[2]
+
+
+def group_key(rule):
+    return rule['entity'], rule['field'], rule['compare']
+
+
+class RuleGroup:
+    def __init__(self, entity, field, compare, rules, active):
+        self.entity = entity
+        self.field = field
+        self.op = OPERATORS[compare]
+        rules = sorted(rules, key=lambda r: r['src'])
+        self.rules = rules
+        self.thresholds = np.array([float(r['value']) for r in rules], dtype=np.float64)
+        self.commands = [convert_message(r['dst'], r['opt'])[:2] for r in rules]
+        # active state survives a rebuild, a rule that already fired does not fire again
+        self.active = np.array([active.get(r['id'], False) for r in rules], dtype=bool)
+        self.slices = {}  # src device -> (first, last + 1) in the sorted rules
+        for i, rule in enumerate(rules):
+            lo, _ = self.slices.get(rule['src'], (i, i))
+            self.slices[rule['src']] = (lo, i + 1)
+
+    def active_states(self):
+        return {rule['id']: active for rule, active in zip(self.rules, self.active.tolist())}
+
+
+class VectorRules:
+    """
+    Threshold rules grouped by (entity, field, compare) into arrays, a batch of samples is compared
+    with all thresholds of its device at once. A rule fires when it starts to match, like the
+    per message path, and only the newest command per target of a batch is returned.
+    """
+    def __init__(self, rule_list, previous=None):
+        active = previous.active_states() if previous is not None else {}
+        grouped = {}
+        for rule in rule_list:
+            grouped.setdefault(group_key(rule), []).append(rule)
+        self.groups = {}  # (entity, field, compare) -> RuleGroup
+        for key, rules in grouped.items():
+            self.groups[key] = RuleGroup(*key, rules, active)
+        self.rules = {rule['id']: rule for rule in rule_list}
+        self.by_entity = {}  # entity -> [RuleGroup]
+        for key, group in self.groups.items():
+            self.by_entity.setdefault(key[0], []).append(group)
+        self.size = len(self.rules)
+
+    def patch(self, rule_list):
+        # changed rows only: the groups a rule leaves or joins are rebuilt, the others keep their arrays;
+        # deleted rows and rules no longer vectorizable are removed, rows sent again unchanged are skipped
+        # and active states are kept by id
+        changed = {}  # group key -> {rule id: rule, None when it leaves the group}
+        for rule in rule_list:
+            old = self.rules.get(rule['id'])
+            if old == rule:
+                continue
+            if old is not None:
+                del self.rules[rule['id']]
+                changed.setdefault(group_key(old), {})[rule['id']] = None
+            if rule.get('is_deleted', 0) == 1 or is_vector_rule(rule) is False:
+                continue
+            self.rules[rule['id']] = rule
+            changed.setdefault(group_key(rule), {})[rule['id']] = rule
+
+        for key, updates in changed.items():
+            group = self.groups.pop(key, None)
+            rules = {r['id']: r for r in group.rules} if group is not None else {}
+            active = group.active_states() if group is not None else {}
+            for rule_id, rule in updates.items():
+                if rule is None:
+                    rules.pop(rule_id, None)
+                else:
+                    rules[rule_id] = rule
+            if len(rules) > 0:
+                self.groups[key] = RuleGroup(*key, list(rules.values()), active)
+        for entity in {key[0] for key in changed}:
+            groups = [group for key, group in self.groups.items() if key[0] == entity]
+            if len(groups) > 0:
+                self.by_entity[entity] = groups
+            else:
+                self.by_entity.pop(entity, None)
+        self.size = len(self.rules)
+
+    def active_states(self):
+        states = {}
+        for group in self.groups.values():
+            states.update(group.active_states())
+        return states
+
+    def evaluate(self, samples):
+        # samples: list of (entity, device, fields) in arrival order
+        # returns {target: (message, rule)}
+        buckets = {}  # (group, device) -> (values, sample positions)
+        for i, (entity, device, fields) in enumerate(samples):
+            for group in self.by_entity.get(entity, ()):
+                if device not in group.slices or group.field not in fields:
+                    continue
+                try:
+                    value = float(fields[group.field])
+                except (TypeError, ValueError):
+                    continue
+                values, positions = buckets.setdefault((group, device), ([], []))
+                values.append(value)
+                positions.append(i)
+
+        fired = {}  # target -> (sample position, message, rule)
+        for (group, device), (values, positions) in buckets.items():
+            lo, hi = group.slices[device]
+            match = group.op(np.array(values)[:, None], group.thresholds[None, lo:hi])  # samples x rules
+            before = np.vstack([group.active[None, lo:hi], match[:-1]])
+            starts = match & ~before  # rule starts to match at this sample
+            group.active[lo:hi] = match[-1]
+            columns = np.flatnonzero(starts.any(axis=0))
+            if len(columns) == 0:
+                continue
+            last = len(values) - 1 - np.argmax(starts[::-1, columns], axis=0)
+            for column, row in zip(columns.tolist(), last.tolist()):
+                target, message = group.commands[lo + column]
+                if target not in fired or fired[target][0] <= positions[row]:
+                    fired[target] = (positions[row], message, group.rules[lo + column])
+
+        return {target: (message, rule) for target, (_, message, rule) in fired.items()}
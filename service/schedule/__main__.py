@@ -4,6 +4,7 @@ from service.schedule.schedule_service import ScheduleService
 if __name__ == '__main__':
     s = ScheduleService()
     s.start()
+    s.register_mqtt_service()
 
     try:
         while True:
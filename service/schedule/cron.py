@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+MACROS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+# (first, last) of minute, hour, day of month, month, day of week (0 or 7 = sunday)
+RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def parse_field(text, first, last):
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+            if step <= 0:
+                raise ValueError(f'invalid step: {text}')
+        if part == '*':
+            lo, hi = first, last
+        elif '-' in part:
+            lo, hi = (int(v) for v in part.split('-', 1))
+        else:
+            lo = int(part)
+            hi = last if step > 1 else lo
+        if lo < first or hi > last or lo > hi:
+            raise ValueError(f'value out of range {first}-{last}: {text}')
+        values.update(range(lo, hi + 1, step))
+    return values
+
+
+class Cron:
+    """
+    Standard five field cron expression (minute hour day-of-month month day-of-week) with
+    lists, ranges, steps and the @daily style macros. Day of month and day of week match
+    either one when both are restricted, like cron does. Times are naive local datetimes.
+    """
+    def __init__(self, expr):
+        self.expr = expr
+        fields = MACROS.get(expr.strip(), expr).split()
+        if len(fields) != 5:
+            raise ValueError(f'cron expression needs 5 fields: {expr}')
+        sets = [parse_field(text, lo, hi) for text, (lo, hi) in zip(fields, RANGES)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = sets
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        # a field starting with '*' (like */1 or */2) does not restrict the day, as in vixie cron
+        self.any_day = fields[2].startswith('*')
+        self.any_weekday = fields[4].startswith('*')
+        self.sorted_minutes = sorted(self.minutes)
+        self.sorted_hours = sorted(self.hours)
+
+    def _day_matches(self, t):
+        weekday = (t.weekday() + 1) % 7  # cron counts from sunday
+        if self.any_day or self.any_weekday:
+            return t.day in self.days and weekday in self.weekdays
+        return t.day in self.days or weekday in self.weekdays
+
+    def next_after(self, t: datetime) -> datetime:
+        # first matching minute strictly after t
+        t = t.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t.year + 5
+        while t.year <= limit:
+            if t.month not in self.months:
+                t = datetime(t.year + t.month // 12, t.month % 12 + 1, 1)
+                continue
+            if self._day_matches(t) is False:
+                t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+                continue
+            hour = next((h for h in self.sorted_hours if h >= t.hour), None)
+            if hour is None:
+                t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+                continue
+            if hour != t.hour:
+                t = t.replace(hour=hour, minute=0)
+            minute = next((m for m in self.sorted_minutes if m >= t.minute), None)
+            if minute is None:
+                t = t.replace(minute=0) + timedelta(hours=1)
+                continue
+            return t.replace(minute=minute)
+        raise ValueError(f'cron expression never matches: {self.expr}')
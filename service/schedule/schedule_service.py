@@ -5,82 +5,103 @@ import threading
 import logging
 import constants.entity
 import constants.http as const_h
-from common.base_service import BaseService
+import constants.schedule as const
 import message_broker.channels as mb_channel
+from common.base_service import BaseService
+from common.change_feed import ChangeFeed
+from service.schedule.timer import LATE, Scheduler
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO)
 
 
 class ScheduleService(BaseService):
-    def __init__(self):
-        super().__init__(constants.entity.SCHEDULE_SERVICE)
-        self.command_channel = mb_channel.DEVICE_COMMAND
+    def __init__(self, command_window=10.0):
+        # short window: schedules of the same target firing together, a schedule's own repeats still go out
+        super().__init__(constants.entity.SCHEDULE_SERVICE, command_window=command_window)
+        self.schedule_changed_channel = mb_channel.SCHEDULE_CHANGED  # channel for schedule change notification
         self.mysql_base_url = f'{const_h.MYSQL_HOST}:{const_h.SERVICE_PORT_MYSQL}'
-        self.schedule_list = []
+        self.scheduler = Scheduler(self.do_schedule)
+        self.state_interval = 5  # seconds between saves of the fire times
+        # schedule changes each 30 seconds, or right after a change notification
+        self.schedule_feed = ChangeFeed('schedule', self.mysql_base_url + const_h.MYSQL_SCHEDULE_LIST,
+                                        self.apply_schedules, 30, params={'inner': True})
 
     def start(self):
         super().start()
         self.init_mqtt_client()
         threading.Thread(target=self.get_schedule_list).start()  # update schedule list regularly
+        threading.Thread(target=self.save_state_loop, daemon=True).start()  # save fire times regularly
         self.start_timer()
 
     def stop(self):
+        self.scheduler.stop()
+        self.save_state()
         self.remove_mqtt_client()
 
+    def register_mqtt_service(self):
+        # schedule changes
+        self.mqtt_listen(self.schedule_changed_channel, self.mqtt_schedule_changed)
+
+    def mqtt_schedule_changed(self, client, userdata, msg):
+        self.schedule_feed.notify()
+
     def get_schedule_list(self):
-        while True:
-            params = {
-                'inner': True,
-                'is_deleted': 0
-            }
-            try:
-                resp = requests.get(self.mysql_base_url + const_h.MYSQL_SCHEDULE_LIST, params=params)
-                resp.raise_for_status()  # Raise an error for bad responses
-                self.schedule_list = resp.json().get('list', [])
-                self.logger.info(f"Fetched {len(self.schedule_list)} schedules")
-            except requests.RequestException as e:
-                logging.error(f"Failed to fetch schedule list: {e}")
-            time.sleep(30)
+        self.restore_state()  # once, before the first sync
+        self.schedule_feed.run()
 
-    def start_timer(self):
-        logging.info("Starting timers for minute, hour, and day schedules")
-        threading.Thread(target=self.minute_schedule).start()  # once per minute
-        threading.Thread(target=self.hour_schedule).start()  # once per hour
-        threading.Thread(target=self.day_schedule).start()  # once per day
+    def apply_schedules(self, schedule_list, full):
+        if full:
+            self.scheduler.sync([s for s in schedule_list if s.get('is_deleted', 0) != 1])
+            self.logger.info(f"Fetched {len(schedule_list)} schedules")
+        else:
+            self.scheduler.patch(schedule_list)
+            if len(schedule_list) > 0:
+                self.logger.info(f"Applied {len(schedule_list)} schedule changes")
 
-    def minute_schedule(self):
-        time.sleep(10)
-        while True:
-            time.sleep(60)
-            self.logger.info("Executing minute schedule")
-            self.do_schedule(60)
+    def restore_state(self):
+        # saved fire times first, so the first sync continues them instead of starting over;
+        # without them (state table missing, route failing) schedules start fresh as before
+        states = []
+        try:
+            resp = requests.get(self.mysql_base_url + const_h.MYSQL_SCHEDULE_STATE)
+            resp.raise_for_status()
+            states = resp.json().get('list', [])
+        except Exception as e:
+            self.logger.error(f"Failed to restore schedule state, starting without it: {e}")
+        self.scheduler.restore(states)
+        self.logger.info(f"Restored fire times of {len(states)} schedules")
 
-    def hour_schedule(self):
-        time.sleep(10)
-        while True:
-            time.sleep(3600)
-            self.logger.info("Executing hour schedule")
-            self.do_schedule(3600)
+    def save_state(self):
+        states = self.scheduler.take_dirty()
+        if len(states) == 0:
+            return
+        try:
+            resp = requests.post(self.mysql_base_url + const_h.MYSQL_SCHEDULE_STATE, json={'list': states})
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            self.scheduler.mark_dirty([state['schedule_id'] for state in states])
+            logging.error(f"Failed to save schedule state: {e}")
 
-    def day_schedule(self):
-        time.sleep(10)
+    def save_state_loop(self):
         while True:
-            time.sleep(86400)
-            self.logger.info("Executing day schedule")
-            self.do_schedule(86400)
+            time.sleep(self.state_interval)
+            self.save_state()
+
+    def start_timer(self):
+        logging.info("Starting the schedule timer")
+        self.scheduler.start()
 
-    def do_schedule(self, duration):
-        for schedule in self.schedule_list:
-            if duration != schedule['duration']:
-                continue
-            device = schedule['target']
-            msg = json.dumps({
-                'type': 'action',
-                'status': schedule['opt']
-            })
-            try:
-                self.mqtt_publish(self.command_channel + device, msg)
-                logging.info(f"Published message to {self.command_channel + device}: {msg}")
-            except Exception as e:
-                self.logger.error(f"Failed to publish message to {self.command_channel + device}: {e}")
+    def do_schedule(self, schedule, due):
+        device = schedule['target']
+        msg = json.dumps({
+            'type': 'action',
+            'status': schedule['opt']
+        })
+        # every missed run of a catch up "all" schedule goes out, the repeats are not suppressed
+        force = schedule.get('catch_up') == const.CATCH_UP_ALL and time.time() - due > LATE
+        try:
+            if self.publish_command(device, msg, force):
+                logging.info(f"Published command to {device}: {msg}")
+        except Exception as e:
+            self.logger.error(f"Failed to publish command to {device}: {e}")
@@ -0,0 +1,238 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from datetime import datetime
+
+import constants.schedule as const
+from common.log import Logger
+from service.schedule.cron import Cron
+
+MAX_WAIT = 60  # seconds, upper bound of one sleep so wall clock changes are seen
+LATE = 60  # seconds a fire may be late before it counts as missed
+
+
+class Trigger:
+    """
+    When a schedule fires: a cron expression, or every `interval` seconds. An interval is
+    counted from the schedule's own phase, or aligned to the local wall clock when `align` is
+    set (3600 fires on the hour, 86400 at midnight).
+    """
+    def __init__(self, interval=0.0, cron=None, align=False):
+        self.interval = interval
+        self.cron = Cron(cron) if cron else None
+        self.align = align
+        self.key = f'{interval:g}|{cron or ""}|{int(align)}'  # stored with the state, a change resets it
+
+    @staticmethod
+    def from_schedule(schedule):
+        # raises ValueError for a schedule that can never fire
+        cron = schedule.get('cron') or None
+        interval = float(schedule.get('duration') or 0)
+        if cron is None and interval <= 0:
+            raise ValueError(f'schedule without duration or cron: {schedule}')
+        return Trigger(interval, cron, bool(schedule.get('align') or 0))
+
+    def next_after(self, t, phase=0.0):
+        # first fire time strictly after t, epoch seconds
+        if self.cron is not None:
+            return self.cron.next_after(datetime.fromtimestamp(t)).timestamp()
+        if self.align:
+            phase = -time.localtime(t).tm_gmtoff
+        n = math.floor((t - phase) / self.interval) + 1
+        return phase + n * self.interval
+
+
+class Entry:
+    __slots__ = ('schedule', 'trigger', 'phase', 'due', 'seq', 'last', 'missed')
+
+    def __init__(self, schedule, trigger, phase):
+        self.schedule = schedule
+        self.trigger = trigger
+        self.phase = phase
+        self.due = 0.0
+        self.seq = 0  # heap item of the entry, older items are stale
+        self.last = None  # last fire time
+        self.missed = 0  # missed runs fired in a row, for CATCH_UP_ALL
+
+    def catch_up(self):
+        policy = self.schedule.get('catch_up') or const.CATCH_UP_ONCE
+        return policy if policy in const.CATCH_UP_POLICIES else const.CATCH_UP_ONCE
+
+
+class Scheduler:
+    """
+    One timer thread over a min heap of (due, seq, id): each tick pops only the schedules that
+    are due and pushes their next fire time, O(log n) per fire. The next time is computed from
+    the previous due time, so execution time does not shift later fires. Changed or removed
+    schedules leave stale heap items behind, skipped on pop and dropped when the heap is rebuilt.
+    Fire times are kept per schedule for saving; restored ones continue where they stopped and
+    the runs missed meanwhile follow the schedule's catch_up policy.
+    """
+    def __init__(self, fire):
+        self.fire = fire  # fire(schedule, due)
+        self.heap = []
+        self.entries = {}  # schedule id -> Entry
+        self.counter = itertools.count(1)
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.saved = {}  # schedule id -> state restored at startup, used when the schedule is first set
+        self.dirty = set()  # schedule ids with state not saved yet
+        self.fired = 0
+        self.skipped = 0
+        self.logger = Logger(prefix='scheduler:')
+
+    def set(self, schedule, now=None):
+        now = time.time() if now is None else now
+        try:
+            trigger = Trigger.from_schedule(schedule)
+        except ValueError as e:
+            self.logger.error(f'invalid schedule {schedule.get("id")}: {e}')
+            self.remove(schedule['id'])
+            return
+        with self.cond:
+            entry = self.entries.get(schedule['id'])
+            if entry is not None and entry.trigger.key == trigger.key:
+                entry.schedule = schedule  # same timing, the next fire time is kept
+                return
+            entry = Entry(schedule, trigger, now)
+            self.entries[schedule['id']] = entry
+            state = self.saved.pop(schedule['id'], None)
+            if state is not None and state['timing'] == trigger.key and state['next_fire_at'] is not None:
+                # continue from the saved fire time, a past one is popped right away and caught up
+                entry.last = state['last_fire_at']
+                entry.phase = state['next_fire_at']
+                self._push(entry, state['next_fire_at'])
+            else:
+                self._push(entry, trigger.next_after(now, entry.phase))
+            self.dirty.add(schedule['id'])
+            self.cond.notify()
+
+    def remove(self, schedule_id):
+        with self.cond:
+            self.entries.pop(schedule_id, None)
+            self.dirty.discard(schedule_id)
+
+    def restore(self, states):
+        # states: [{'schedule_id', 'last_fire_at', 'next_fire_at', 'timing'}], before the first sync
+        with self.cond:
+            self.saved = {state['schedule_id']: state for state in states}
+
+    def take_dirty(self):
+        # states changed since the last call, put back with mark_dirty when saving fails
+        with self.cond:
+            states = []
+            for schedule_id in self.dirty:
+                entry = self.entries.get(schedule_id)
+                if entry is None:
+                    continue
+                states.append({
+                    'schedule_id': schedule_id,
+                    'last_fire_at': entry.last,
+                    'next_fire_at': entry.due,
+                    'timing': entry.trigger.key,
+                })
+            self.dirty = set()
+            return states
+
+    def mark_dirty(self, schedule_ids):
+        with self.cond:
+            self.dirty.update(i for i in schedule_ids if i in self.entries)
+
+    def sync(self, schedule_list, now=None):
+        # full list: set every schedule, drop the ones no longer listed
+        now = time.time() if now is None else now
+        ids = set()
+        for schedule in schedule_list:
+            ids.add(schedule['id'])
+            self.set(schedule, now)
+        with self.cond:
+            for schedule_id in [i for i in self.entries if i not in ids]:
+                del self.entries[schedule_id]
+            self.saved = {}  # states of schedules that are gone
+
+    def patch(self, schedule_list, now=None):
+        # changed rows only: deleted ones are removed, the others set in place
+        now = time.time() if now is None else now
+        for schedule in schedule_list:
+            if schedule.get('is_deleted', 0) == 1:
+                self.remove(schedule['id'])
+            else:
+                self.set(schedule, now)
+
+    def _push(self, entry, due):
+        entry.due = due
+        entry.seq = next(self.counter)
+        heapq.heappush(self.heap, (due, entry.seq, entry.schedule['id']))
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self._rebuild()
+
+    def _rebuild(self):
+        self.heap = [(e.due, e.seq, i) for i, e in self.entries.items()]
+        heapq.heapify(self.heap)
+
+    def pop_due(self, now):
+        # due schedules as (schedule, due), their next fire is pushed right away
+        fired = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            due, seq, schedule_id = heapq.heappop(self.heap)
+            entry = self.entries.get(schedule_id)
+            if entry is None or entry.seq != seq:
+                continue  # stale
+            policy = entry.catch_up()
+            if policy == const.CATCH_UP_SKIP and now - due > LATE:
+                self.skipped += 1
+            else:
+                fired.append((entry.schedule, due))
+                entry.last = due
+            next_due = entry.trigger.next_after(due, entry.phase)
+            if next_due <= now and policy == const.CATCH_UP_ALL and entry.missed < const.MAX_CATCH_UP:
+                entry.missed += 1  # popped again in this loop
+            elif next_due <= now:
+                # restart or held up timer (clock change, suspend), the other missed fires are dropped
+                next_due = entry.trigger.next_after(now, entry.phase)
+                entry.missed = 0
+            else:
+                entry.missed = 0
+            self._push(entry, next_due)
+            self.dirty.add(schedule_id)
+        return fired
+
+    def run(self):
+        while True:
+            with self.cond:
+                if self.stopped:
+                    return
+                now = time.time()
+                fired = self.pop_due(now)
+                if len(fired) == 0:
+                    wait = self.heap[0][0] - now if len(self.heap) > 0 else MAX_WAIT
+                    self.cond.wait(min(wait, MAX_WAIT))
+                    continue
+            for schedule, due in fired:
+                try:
+                    self.fire(schedule, due)
+                except Exception as e:
+                    self.logger.error(f'schedule {schedule["id"]} failed: {e}')
+            self.fired += len(fired)
+
+    def start(self):
+        self.stopped = False
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            return {
+                'schedules': len(self.entries),
+                'heap': len(self.heap),
+                'fired': self.fired,
+                'skipped': self.skipped,
+                'unsaved': len(self.dirty),
+                'next': self.heap[0][0] if len(self.heap) > 0 else None,
+            }
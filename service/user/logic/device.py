@@ -74,7 +74,12 @@ class Logic(Common):
                 "code": 500,
                 "message": "invalid command"
             }
-        self.delegate.mqtt_publish(self.command_channel+target, msg)
+        # sent by the user on purpose, never suppressed (a repeat may fix a lost command)
+        if self.delegate.publish_command(target, msg, force=True) is False:
+            return {
+                "code": 500,
+                "message": "command not sent"
+            }
 
         return {
             "code": 0,
@@ -1,6 +1,8 @@
 import requests
 import constants.http as const_h
+import constants.schedule as const_s
 from http import HTTPMethod
+from service.schedule.cron import Cron
 from service.user.logic.base import Common
 
 
@@ -36,6 +38,12 @@ class Logic(Common):
         }
 
     def create(self, params):
+        err = check_timing(params)
+        if err != "":
+            return {
+                'code': 500,
+                'message': err
+            }
         resp = requests.post(self.mysql_base_url + const_h.MYSQL_SCHEDULE_SAVE, json=params)
         if resp.status_code != 200:
             return {
@@ -63,6 +71,12 @@ class Logic(Common):
                 'code': 500,
                 'message': 'missing params: id'
             }
+        err = check_timing(params)
+        if err != "":
+            return {
+                'code': 500,
+                'message': err
+            }
         resp = requests.post(self.mysql_base_url + const_h.MYSQL_SCHEDULE_SAVE, json=params)
         if resp.status_code != 200:
             return {
@@ -92,3 +106,22 @@ class Logic(Common):
             'code': 0,
             'message': "success",
         }
+
+
+def check_timing(params):
+    # a known catch up policy, and a cron expression or duration seconds to fire by
+    if params.get('catch_up') and params['catch_up'] not in const_s.CATCH_UP_POLICIES:
+        return f'invalid catch_up, one of: {", ".join(const_s.CATCH_UP_POLICIES)}'
+    if params.get('cron'):
+        try:
+            Cron(params['cron'])
+        except ValueError as e:
+            return f'invalid cron: {e}'
+        return ""
+    try:
+        duration = float(params.get('duration', 0))
+    except (TypeError, ValueError):
+        return 'invalid duration'
+    if duration <= 0:
+        return 'missing params: duration or cron'
+    return ""
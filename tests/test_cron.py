@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from service.schedule.cron import Cron
+
+MONDAY = datetime(2024, 1, 1, 12, 0)  # monday the 1st
+
+
+def test_star_step_day_of_month_follows_weekday():
+    # */1 does not restrict the day of month, only fridays match
+    assert Cron('0 9 */1 * 5').next_after(MONDAY) == datetime(2024, 1, 5, 9, 0)
+
+
+def test_star_step_weekday_follows_day_of_month():
+    assert Cron('0 9 15 * */1').next_after(MONDAY) == datetime(2024, 1, 15, 9, 0)
+
+
+def test_star_step_day_of_month_with_stepped_weekday():
+    # both start with '*': a day must match both fields, odd days that are sundays, tuesdays, ...
+    assert Cron('0 9 */2 * */2').next_after(MONDAY) == datetime(2024, 1, 7, 9, 0)
+
+
+def test_restricted_fields_match_either_one():
+    # the 10th or a friday, whichever comes first
+    assert Cron('0 9 10 * 5').next_after(MONDAY) == datetime(2024, 1, 5, 9, 0)
+    assert Cron('0 9 3 * 5').next_after(MONDAY) == datetime(2024, 1, 3, 9, 0)
+
+
+def test_macros_and_steps():
+    assert Cron('@daily').next_after(MONDAY) == datetime(2024, 1, 2, 0, 0)
+    assert Cron('*/15 * * * *').next_after(datetime(2024, 1, 1, 12, 7)) == datetime(2024, 1, 1, 12, 15)
@@ -0,0 +1,38 @@
+import json
+
+import constants.schedule as const
+from service.schedule.schedule_service import ScheduleService
+
+NOW = 1_700_000_000.0
+
+
+def run_missed(policy, missed):
+    service = ScheduleService()
+    sent = []
+    service.command_publisher.publish_func = lambda topic, message: sent.append((topic, message))
+    schedule = {'id': 1, 'target': 'lamp', 'opt': True, 'duration': 60, 'catch_up': policy}
+    scheduler = service.scheduler
+    scheduler.restore([{
+        'schedule_id': 1,
+        'last_fire_at': NOW - (missed + 1) * 60,
+        'next_fire_at': NOW - missed * 60,
+        'timing': '60||0',
+    }])
+    scheduler.sync([schedule], NOW)
+    for schedule, due in scheduler.pop_due(NOW):
+        service.do_schedule(schedule, due)
+    return sent
+
+
+def test_catch_up_all_publishes_every_missed_run():
+    sent = run_missed(const.CATCH_UP_ALL, 5)
+    assert len(sent) == 6
+    assert json.loads(sent[0][1]) == {'type': 'action', 'status': True}
+
+
+def test_catch_up_once_publishes_once():
+    assert len(run_missed(const.CATCH_UP_ONCE, 5)) == 1
+
+
+def test_catch_up_skip_publishes_nothing():
+    assert run_missed(const.CATCH_UP_SKIP, 5) == []
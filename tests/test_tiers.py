@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from influxdb_client.client.flux_table import FluxRecord
+
+from database.influxdb.query import QueryFilter
+from database.influxdb.tiers import TierManager, merge_windows, rollup_query
+
+DAY = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.sql = None
+
+    def query_api(self):
+        return self
+
+    def query(self, sql, org=None, params=None):
+        self.sql = sql
+        records = [FluxRecord(0, values={'area': area, 'agg': agg, '_time': at, '_value': value})
+                   for area, agg, at, value in self.rows]
+        return [SimpleNamespace(records=records)]
+
+
+def ms(t):
+    return int(t.timestamp() * 1000)
+
+
+def test_mean_across_watermark():
+    watermark = DAY + timedelta(days=1, hours=14)
+    stop = DAY + timedelta(days=1, hours=20)
+    client = FakeClient([
+        # hourly rollups, the second day only up to the watermark
+        ('hall', 'sum', DAY, 240.0),
+        ('hall', 'count', DAY, 24.0),
+        ('hall', 'sum', DAY + timedelta(days=1), 140.0),
+        ('hall', 'count', DAY + timedelta(days=1), 14.0),
+        # raw points after the watermark, the window start is cut to the watermark
+        ('hall', 'sum', watermark, 1200.0),
+        ('hall', 'count', watermark, 60.0),
+    ])
+    tiers = TierManager(SimpleNamespace(bucket='data', org='org', client=client))
+    tiers.hour.watermark = watermark
+
+    result = tiers.aggregate(QueryFilter('temperature', start=DAY, stop=stop), '1d', 'mean')
+
+    assert 'timeSrc: "_start"' in client.sql
+    assert result == [{
+        'area': 'hall',
+        'time': [ms(DAY + timedelta(days=1)), ms(stop)],
+        'value': [10.0, (140.0 + 1200.0) / (14.0 + 60.0)],
+    }]
+
+
+def test_window_timestamps():
+    start = DAY + timedelta(hours=3)  # range start inside the first window
+    parts = [
+        ('hall', 'max', start, 5.0),
+        ('hall', 'max', DAY + timedelta(hours=6), 7.0),
+        ('hall', 'max', DAY + timedelta(hours=8), 9.0),
+        ('hall', 'max', DAY + timedelta(hours=13), 4.0),
+        ('yard', 'max', DAY + timedelta(hours=7), 1.0),
+    ]
+
+    result = merge_windows(parts, 'max', 6 * 3600, DAY + timedelta(hours=14))
+
+    assert result == [
+        {'area': 'hall', 'time': [ms(DAY + timedelta(hours=6)), ms(DAY + timedelta(hours=12)),
+                                  ms(DAY + timedelta(hours=14))], 'value': [5.0, 9.0, 4.0]},
+        {'area': 'yard', 'time': [ms(DAY + timedelta(hours=12))], 'value': [1.0]},
+    ]
+
+
+def test_mean_needs_sum_and_count():
+    # windows rolled up before sums were stored have no mean
+    parts = [('hall', 'count', DAY, 24.0)]
+    assert merge_windows(parts, 'mean', 86400, DAY + timedelta(days=1)) == []
+
+
+def test_last_takes_the_raw_part():
+    watermark = DAY + timedelta(hours=10)
+    parts = [('hall', 'last', watermark, 2.0), ('hall', 'last', DAY, 1.0)]
+    assert merge_windows(parts, 'last', 86400, DAY + timedelta(days=1))[0]['value'] == [2.0]
+
+
+def test_rollup_only_query():
+    sql = rollup_query('data_1h', 'data', (False, False, False), '1d', 'mean', False)
+    assert 'raw' not in sql
+    assert 'set: ["sum", "count"]' in sql